@@ -1,14 +1,23 @@
 from langgraph.graph import StateGraph, END
 from typing import TypedDict
-from pdf_extractor import extract_text
+from pdf_extractor import extract_document
 from fair_extractor import extract_fair_metadata, store_fair_metadata, log_provenance
 from curation_agents import update_curation_status
+from header_extractor import extract_header_fields
 from react_agents import create_metadata_extraction_agent, create_curation_agent, create_quality_agent
-from process_pdf import process_pdf
+from process_pdf import process_pdf, update_document_payload, get_file_hash, image_dir
+from qdrant_setup import get_qdrant_client
 from db_setup import get_connection
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 import json
+import uuid
+
+# Content extraction/embedding runs alongside the LLM agents; futures are keyed by run_id.
+_content_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CONTENT_WORKERS', '2')),
+                                       thread_name_prefix="content")
+_content_tasks = {}
 
 def extract_metadata_from_result(result, default=None):
     """Helper to extract metadata from agent result consistently"""
@@ -81,6 +90,7 @@ class WorkflowState(TypedDict):
     pdf_path: str
     filename: str
     extracted_text: str
+    extracted_document: dict
     fair_metadata: dict
     validation_result: dict
     enrichment_result: dict
@@ -88,6 +98,9 @@ class WorkflowState(TypedDict):
     conflict_resolution: dict
     provenance_chain: list
     processing_status: str
+    file_hash: str
+    file_size: int
+    run_id: str
 
 def _log(step: str, msg: str, **kwargs):
     """Print workflow/agent output to terminal for live logs."""
@@ -97,9 +110,14 @@ def _log(step: str, msg: str, **kwargs):
 def extract_pdf_text(state: WorkflowState) -> WorkflowState:
     _log("extract_text", "Starting PDF text extraction", file=state["filename"])
     try:
-        texts = extract_text(state["pdf_path"])
+        if not state.get("file_hash"):
+            state["file_hash"] = get_file_hash(state["pdf_path"])
+        # Concurrent runs would otherwise overwrite each other's page_N_img_M files.
+        document = extract_document(state["pdf_path"], output_dir=image_dir(state["file_hash"]))
+        texts = document['texts']
         full_text = "\n\n".join([item['text'] for item in texts])
         state["extracted_text"] = full_text
+        state["extracted_document"] = document
         state["provenance_chain"] = state.get("provenance_chain", [])
         state["provenance_chain"].append({
             "action": "extract_text",
@@ -136,7 +154,7 @@ def extract_fair_react(state: WorkflowState) -> WorkflowState:
         
         observation = {
             "text": primary_text,
-            "metadata": {}
+            "metadata": extract_header_fields(state["extracted_text"], state["extracted_document"].get("metadata"))
         }
         
         result = agent.run(observation, max_iterations=6)
@@ -165,7 +183,7 @@ def extract_fair_react(state: WorkflowState) -> WorkflowState:
         })
         log_provenance(state["filename"], "extract_fair_react_error", "metadata_extraction_agent",
                       input_data={"error": str(e)})
-        state["fair_metadata"] = extract_fair_metadata(state["extracted_text"][:8000])
+        state["fair_metadata"] = extract_fair_metadata(state["extracted_text"][:8000], pdf_info=state["extracted_document"].get("metadata"))
         log_provenance(state["filename"], "extract_fair_fallback", "fair_extractor",
                       output_data=state["fair_metadata"])
     return state
@@ -275,11 +293,35 @@ def quality_assurance_react(state: WorkflowState) -> WorkflowState:
         state["quality_assessment"] = state.get("quality_assessment", {})
     return state
 
+def _store_content_task(pdf_path, file_hash, file_size, document):
+    # Runs on the content pool while the metadata agents work; FAIR fields are
+    # patched onto the points in store_content once the agents have finished.
+    return process_pdf(pdf_path, skip_fair=True, file_hash=file_hash, file_size=file_size,
+                       extracted=document)
+
+def start_content(state: WorkflowState) -> WorkflowState:
+    _log("start_content", "Extracting and embedding content in background", file=state["filename"])
+    _content_tasks[state["run_id"]] = _content_executor.submit(
+        _store_content_task, state["pdf_path"], state.get("file_hash"), state.get("file_size"),
+        state.get("extracted_document")
+    )
+    return state
+
 def store_content(state: WorkflowState) -> WorkflowState:
-    _log("store_content", "Storing content and vectors", file=state["filename"])
+    _log("store_content", "Waiting for content and vectors", file=state["filename"])
     try:
-        process_pdf(state["pdf_path"], skip_fair=True, fair_metadata=state["fair_metadata"])
-        _log("store_content", "Done")
+        future = _content_tasks.pop(state["run_id"], None)
+        if future is None:
+            result = _store_content_task(state["pdf_path"], state.get("file_hash"), state.get("file_size"),
+                                         state.get("extracted_document"))
+        else:
+            result = future.result()
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        if state["fair_metadata"]:
+            update_document_payload(get_qdrant_client(), os.getenv('QDRANT_COLLECTION', 'pdf_documents'),
+                                    result.get("filename", state["filename"]), state["fair_metadata"])
+        _log("store_content", "Done", points=result.get("points", 0))
         state["provenance_chain"].append({
             "action": "store_content",
             "agent": "content_storage",
@@ -287,7 +329,7 @@ def store_content(state: WorkflowState) -> WorkflowState:
             "status": "success"
         })
         log_provenance(state["filename"], "store_content", "content_storage",
-                      output_data={"status": "stored"})
+                      output_data={"status": "stored", "points": result.get("points", 0)})
     except Exception as e:
         _log("store_content", "Error", error=str(e))
         state["provenance_chain"].append({
@@ -315,6 +357,7 @@ def store_fair(state: WorkflowState) -> WorkflowState:
 workflow = StateGraph(WorkflowState)
 
 workflow.add_node("extract_text", extract_pdf_text)
+workflow.add_node("start_content", start_content)
 workflow.add_node("extract_fair_react", extract_fair_react)
 workflow.add_node("curate_react", curate_react)
 workflow.add_node("quality_assurance_react", quality_assurance_react)
@@ -322,7 +365,8 @@ workflow.add_node("store_content", store_content)
 workflow.add_node("store_fair", store_fair)
 
 workflow.set_entry_point("extract_text")
-workflow.add_edge("extract_text", "extract_fair_react")
+workflow.add_edge("extract_text", "start_content")
+workflow.add_edge("start_content", "extract_fair_react")
 workflow.add_edge("extract_fair_react", "curate_react")
 workflow.add_edge("curate_react", "quality_assurance_react")
 workflow.add_edge("quality_assurance_react", "store_content")
@@ -331,20 +375,29 @@ workflow.add_edge("store_fair", END)
 
 app = workflow.compile()
 
-def process_paper(pdf_path):
+def process_paper(pdf_path, file_hash=None, file_size=None):
     filename = os.path.basename(pdf_path)
     _log("process_paper", "Starting agent workflow", file=filename)
     initial_state = {
         "pdf_path": pdf_path,
         "filename": filename,
         "extracted_text": "",
+        "extracted_document": None,
         "fair_metadata": {},
         "validation_result": {},
         "enrichment_result": {},
         "quality_assessment": {},
         "conflict_resolution": {},
         "provenance_chain": [],
-        "processing_status": "processing"
+        "processing_status": "processing",
+        "file_hash": file_hash,
+        "file_size": file_size,
+        "run_id": str(uuid.uuid4())
     }
-    result = app.invoke(initial_state)
+    try:
+        result = app.invoke(initial_state)
+    finally:
+        future = _content_tasks.pop(initial_state["run_id"], None)
+        if future is not None:
+            future.cancel()
     return result
@@ -1,39 +1,66 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from qdrant_setup import get_qdrant_client
-from db_setup import get_connection
-from sentence_transformers import SentenceTransformer
+from db_setup import db_connection
+import embedding_service
+from llm_client import llm
 from dotenv import load_dotenv
-from process_pdf import process_pdf
-from agent_workflow import process_paper
+import ingest_jobs
+from upload_stream import MultipartFileSink, UploadError, UploadTooLarge, FORM_OVERHEAD_BYTES
+from multipart.exceptions import MultipartParseError
 import os
-import shutil
+import uuid
 from pathlib import Path
 
 load_dotenv()
 
 app = FastAPI()
-model = SentenceTransformer('all-MiniLM-L6-v2')
 qdrant = get_qdrant_client()
 collection_name = os.getenv('QDRANT_COLLECTION', 'pdf_documents')
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '500')) * 1024 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse before the multipart body is read when the client declares its size.
+    if request.url.path == "/upload":
+        content_length = request.headers.get("content-length")
+        # Content-Length covers the whole multipart body, so allow the same framing overhead as the parser.
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit"})
+    return await call_next(request)
+
+@app.on_event("startup")
+def warm_up_models():
+    embedding_service.warm_up()
+    ingest_jobs.resume_queued_jobs()
+
+@app.on_event("shutdown")
+def stop_ingest_workers():
+    ingest_jobs.shutdown()
 
 @app.get("/")
 def root():
     return {"message": "PDF Document API"}
 
+@app.get("/metrics")
+def get_metrics():
+    return {"embedding": embedding_service.get_metrics(), "llm": llm.stats()}
+
 @app.get("/documents")
 def list_documents():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT filename, file_size, total_pages, upload_timestamp, processing_status
-        FROM pdf_metadata 
-        ORDER BY upload_timestamp DESC
-    """)
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT filename, file_size, total_pages, upload_timestamp, processing_status
+            FROM pdf_metadata 
+            ORDER BY upload_timestamp DESC
+        """)
+        rows = cur.fetchall()
     
     documents = []
     for row in rows:
@@ -49,21 +76,20 @@ def list_documents():
 
 @app.get("/documents/{filename}")
 def get_document(filename: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT file_size, total_pages, file_hash, upload_timestamp, processing_status, metadata
-        FROM pdf_metadata WHERE filename = %s
-    """, (filename,))
-    meta_row = cur.fetchone()
-    
-    cur.execute("""
-        SELECT id, page_number, content_type, content, image_path, table_data, created_at
-        FROM pdf_documents WHERE filename = %s ORDER BY page_number
-    """, (filename,))
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+    
+        cur.execute("""
+            SELECT file_size, total_pages, file_hash, upload_timestamp, processing_status, metadata
+            FROM pdf_metadata WHERE filename = %s
+        """, (filename,))
+        meta_row = cur.fetchone()
+    
+        cur.execute("""
+            SELECT id, page_number, content_type, content, image_path, table_data, created_at
+            FROM pdf_documents WHERE filename = %s ORDER BY page_number
+        """, (filename,))
+        rows = cur.fetchall()
     
     if not rows and not meta_row:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -100,23 +126,23 @@ def get_document(filename: str):
 @app.get("/documents/{filename}/status")
 def get_document_status(filename: str):
     """Get processing and agent curation status for a document."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT processing_status, file_size, total_pages, upload_timestamp
-        FROM pdf_metadata WHERE filename = %s
-    """, (filename,))
-    meta = cur.fetchone()
-    cur.execute("""
-        SELECT curation_status, quality_score, validation_status,
-               provenance_chain, updated_at
-        FROM fair_metadata WHERE filename = %s
-    """, (filename,))
-    fair = cur.fetchone()
-    cur.execute("SELECT COUNT(*) FROM pdf_documents WHERE filename = %s", (filename,))
-    chunks = cur.fetchone()[0]
-    conn.close()
-    if not meta:
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT processing_status, file_size, total_pages, upload_timestamp
+            FROM pdf_metadata WHERE filename = %s
+        """, (filename,))
+        meta = cur.fetchone()
+        cur.execute("""
+            SELECT curation_status, quality_score, validation_status,
+                   provenance_chain, updated_at
+            FROM fair_metadata WHERE filename = %s
+        """, (filename,))
+        fair = cur.fetchone()
+        cur.execute("SELECT COUNT(*) FROM pdf_documents WHERE filename = %s", (filename,))
+        chunks = cur.fetchone()[0]
+    job = ingest_jobs.latest_job(filename)
+    if not meta and not job:
         raise HTTPException(status_code=404, detail="Document not found")
     return {
         "filename": filename,
@@ -126,7 +152,13 @@ def get_document_status(filename: str):
             "total_pages": meta[2],
             "upload_timestamp": str(meta[3]),
             "chunks_stored": chunks,
-        },
+        } if meta else None,
+        "latest_job": {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "error": job["error"],
+        } if job else None,
         "agent_curation": {
             "curation_status": fair[0] if fair else None,
             "quality_score": fair[1] if fair else None,
@@ -138,26 +170,24 @@ def get_document_status(filename: str):
 
 @app.get("/documents/{filename}/metadata")
 def get_document_metadata(filename: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT file_size, total_pages, file_hash, upload_timestamp, processing_status, metadata, created_at
-        FROM pdf_metadata WHERE filename = %s
-    """, (filename,))
-    row = cur.fetchone()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT file_size, total_pages, file_hash, upload_timestamp, processing_status, metadata, created_at
+            FROM pdf_metadata WHERE filename = %s
+        """, (filename,))
+        row = cur.fetchone()
     
-    if not row:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Document metadata not found")
-    
-    cur.execute("""
-        SELECT content_type, COUNT(*) 
-        FROM pdf_documents 
-        WHERE filename = %s 
-        GROUP BY content_type
-    """, (filename,))
-    chunk_stats = {r[0]: r[1] for r in cur.fetchall()}
-    conn.close()
+        if not row:
+            raise HTTPException(status_code=404, detail="Document metadata not found")
+    
+        cur.execute("""
+            SELECT content_type, COUNT(*) 
+            FROM pdf_documents 
+            WHERE filename = %s 
+            GROUP BY content_type
+        """, (filename,))
+        chunk_stats = {r[0]: r[1] for r in cur.fetchall()}
     
     return {
         "filename": filename,
@@ -171,63 +201,111 @@ def get_document_metadata(filename: str):
         "chunk_statistics": chunk_stats
     }
 
-@app.post("/upload")
-async def upload_and_process(file: UploadFile = File(...), use_agent: bool = False):
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported")
-    
-    file_path = UPLOAD_DIR / file.filename
+# The body is parsed by MultipartFileSink rather than an UploadFile parameter, so describe it for the docs.
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"]
+        }}}
+    }
+}
+
+async def _receive_upload(request):
+    """Stream the multipart body to a temporary file; returns the sink once the file is complete."""
+    sink = MultipartFileSink(request.headers.get("content-type"), UPLOAD_DIR,
+                             max_bytes=MAX_UPLOAD_BYTES, suffix=".pdf")
+    try:
+        buffered = []
+        pending = 0
+        async for chunk in request.stream():
+            buffered.append(chunk)
+            pending += len(chunk)
+            # Hand the parser and disk writes large blocks so the event loop is not blocked.
+            if pending >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(sink.write, b"".join(buffered))
+                buffered, pending = [], 0
+        if buffered:
+            await run_in_threadpool(sink.write, b"".join(buffered))
+        await run_in_threadpool(sink.finish)
+    except BaseException:
+        sink.cleanup()
+        raise
+    return sink
+
+@app.post("/upload", status_code=202, openapi_extra=UPLOAD_OPENAPI)
+async def upload_and_process(request: Request, use_agent: bool = False, force: bool = False):
+    try:
+        sink = await _receive_upload(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (UploadError, MultipartParseError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = sink.filename
+    # Each upload gets its own directory, so a later upload with the same name cannot replace
+    # the bytes a queued or running job (and its recorded hash) refers to.
+    job_id = str(uuid.uuid4())
+    file_path = UPLOAD_DIR / job_id / filename
     
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        if use_agent:
-            result = process_paper(str(file_path))
-            return {
-                "status": "success",
-                "filename": file.filename,
-                "message": "PDF processed with agent workflow",
-                "fair_metadata": result.get("fair_metadata", {})
-            }
-        else:
-            result = process_pdf(str(file_path))
-            if "error" in result:
-                raise HTTPException(status_code=500, detail=result["error"])
-            
-            return {
-                "status": "success",
-                "filename": file.filename,
-                "message": f"PDF processed successfully. {result.get('points', 0)} items stored.",
-                "details": result
-            }
+        file_path.parent.mkdir()
+        os.replace(sink.temp_path, file_path)
+        await run_in_threadpool(
+            ingest_jobs.enqueue, filename, str(file_path),
+            use_agent=use_agent,
+            options={"force": force, "file_hash": sink.file_hash, "file_size": sink.size},
+            job_id=job_id
+        )
     except Exception as e:
+        sink.cleanup()
         if file_path.exists():
             file_path.unlink()
+        if file_path.parent.exists():
+            file_path.parent.rmdir()
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "filename": filename,
+        "message": f"PDF queued for processing. Poll /jobs/{job_id} for progress."
+    }
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = ingest_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/documents/{filename}/chunks")
 def get_document_chunks(filename: str, content_type: str = None):
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    if content_type:
-        cur.execute("""
-            SELECT id, page_number, content_type, content, image_path, table_data, qdrant_id, created_at
-            FROM pdf_documents 
-            WHERE filename = %s AND content_type = %s 
-            ORDER BY page_number, id
-        """, (filename, content_type))
-    else:
-        cur.execute("""
-            SELECT id, page_number, content_type, content, image_path, table_data, qdrant_id, created_at
-            FROM pdf_documents 
-            WHERE filename = %s 
-            ORDER BY page_number, id
-        """, (filename,))
+    with db_connection() as conn:
+        cur = conn.cursor()
+    
+        if content_type:
+            cur.execute("""
+                SELECT id, page_number, content_type, content, image_path, table_data, qdrant_id, created_at
+                FROM pdf_documents 
+                WHERE filename = %s AND content_type = %s 
+                ORDER BY page_number, id
+            """, (filename, content_type))
+        else:
+            cur.execute("""
+                SELECT id, page_number, content_type, content, image_path, table_data, qdrant_id, created_at
+                FROM pdf_documents 
+                WHERE filename = %s 
+                ORDER BY page_number, id
+            """, (filename,))
     
-    rows = cur.fetchall()
-    conn.close()
+        rows = cur.fetchall()
     
     if not rows:
         raise HTTPException(status_code=404, detail="Document or chunks not found")
@@ -255,16 +333,15 @@ def get_document_chunks(filename: str, content_type: str = None):
 
 @app.get("/documents/{filename}/text")
 def get_document_text(filename: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT page_number, content, created_at
-        FROM pdf_documents 
-        WHERE filename = %s AND content_type = 'text'
-        ORDER BY page_number
-    """, (filename,))
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT page_number, content, created_at
+            FROM pdf_documents 
+            WHERE filename = %s AND content_type = 'text'
+            ORDER BY page_number
+        """, (filename,))
+        rows = cur.fetchall()
     
     if not rows:
         raise HTTPException(status_code=404, detail="No text content found for this document")
@@ -285,16 +362,15 @@ def get_document_text(filename: str):
 
 @app.get("/documents/{filename}/images")
 def get_document_images(filename: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT page_number, image_path, created_at
-        FROM pdf_documents 
-        WHERE filename = %s AND content_type = 'image'
-        ORDER BY page_number
-    """, (filename,))
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT page_number, image_path, created_at
+            FROM pdf_documents 
+            WHERE filename = %s AND content_type = 'image'
+            ORDER BY page_number
+        """, (filename,))
+        rows = cur.fetchall()
     
     if not rows:
         raise HTTPException(status_code=404, detail="No images found for this document")
@@ -315,16 +391,15 @@ def get_document_images(filename: str):
 
 @app.get("/documents/{filename}/tables")
 def get_document_tables(filename: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT page_number, table_data, created_at
-        FROM pdf_documents 
-        WHERE filename = %s AND content_type = 'table'
-        ORDER BY page_number
-    """, (filename,))
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT page_number, table_data, created_at
+            FROM pdf_documents 
+            WHERE filename = %s AND content_type = 'table'
+            ORDER BY page_number
+        """, (filename,))
+        rows = cur.fetchall()
     
     if not rows:
         raise HTTPException(status_code=404, detail="No tables found for this document")
@@ -343,11 +418,29 @@ def get_document_tables(filename: str):
         "tables": tables
     }
 
+def _hit_from_payload(result):
+    """Build a search hit from the Qdrant payload when it carries the chunk content itself."""
+    payload = result.payload or {}
+    content_type = payload.get("content_type")
+    content_key = {"text": "content", "table": "table_data", "image": "image_path"}.get(content_type)
+    if not content_key or content_key not in payload or "filename" not in payload:
+        return None
+    return {
+        "filename": payload["filename"],
+        "page": payload.get("page"),
+        "type": content_type,
+        "content": payload.get("content"),
+        "image_path": payload.get("image_path"),
+        "table_data": payload.get("table_data"),
+        "score": result.score,
+        "metadata": payload
+    }
+
 @app.get("/search")
 def search_documents(query: str, limit: int = 5, author: str = None, journal: str = None, keyword: str = None):
     from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny
     
-    query_embedding = model.encode(query).tolist()
+    query_embedding = embedding_service.encode(query).tolist()
     
     filter_conditions = []
     if author:
@@ -368,18 +461,28 @@ def search_documents(query: str, limit: int = 5, author: str = None, journal: st
     
     results = qdrant.search(**search_params)
     
-    conn = get_connection()
-    cur = conn.cursor()
-    
     search_results = []
+    missing_ids = []
     for result in results:
-        cur.execute("""
-            SELECT filename, page_number, content_type, content, image_path, table_data
-            FROM pdf_documents WHERE qdrant_id = %s
-        """, (result.id,))
-        row = cur.fetchone()
-        if row:
-            search_results.append({
+        hit = _hit_from_payload(result)
+        search_results.append(hit)
+        if hit is None:
+            missing_ids.append(str(result.id))
+    
+    rows = {}
+    if missing_ids:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT qdrant_id, filename, page_number, content_type, content, image_path, table_data
+                FROM pdf_documents WHERE qdrant_id = ANY(%s)
+            """, (missing_ids,))
+            rows = {row[0]: row[1:] for row in cur.fetchall()}
+    
+    for index, result in enumerate(results):
+        if search_results[index] is None and str(result.id) in rows:
+            row = rows[str(result.id)]
+            search_results[index] = {
                 "filename": row[0],
                 "page": row[1],
                 "type": row[2],
@@ -388,25 +491,24 @@ def search_documents(query: str, limit: int = 5, author: str = None, journal: st
                 "table_data": row[5],
                 "score": result.score,
                 "metadata": result.payload
-            })
+            }
+    search_results = [hit for hit in search_results if hit is not None]
     
-    conn.close()
     return {"query": query, "filters": {"author": author, "journal": journal, "keyword": keyword}, "results": search_results}
 
 @app.get("/documents/{filename}/fair")
 def get_fair_metadata(filename: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT doi, handle, ark, title, authors, abstract, keywords, publication_date,
-               journal, license, repository_url, data_availability, methodology,
-               citation_info, pacs_codes, mesh_terms, subject_classifications,
-               metadata_schema, datacite_schema, provenance_chain, curation_status,
-               quality_score, validation_status
-        FROM fair_metadata WHERE filename = %s
-    """, (filename,))
-    row = cur.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT doi, handle, ark, title, authors, abstract, keywords, publication_date,
+                   journal, license, repository_url, data_availability, methodology,
+                   citation_info, pacs_codes, mesh_terms, subject_classifications,
+                   metadata_schema, datacite_schema, provenance_chain, curation_status,
+                   quality_score, validation_status
+            FROM fair_metadata WHERE filename = %s
+        """, (filename,))
+        row = cur.fetchone()
     
     if not row:
         raise HTTPException(status_code=404, detail="FAIR metadata not found")
@@ -446,14 +548,13 @@ def get_fair_metadata(filename: str):
 
 @app.get("/documents/{filename}/provenance")
 def get_provenance(filename: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT action, agent, timestamp, input_data, output_data, metadata
-        FROM provenance WHERE filename = %s ORDER BY timestamp
-    """, (filename,))
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT action, agent, timestamp, input_data, output_data, metadata
+            FROM provenance WHERE filename = %s ORDER BY timestamp
+        """, (filename,))
+        rows = cur.fetchall()
     
     return {
         "filename": filename,
@@ -0,0 +1,345 @@
+"""Ingest a directory or manifest of PDFs with pipelined parse, embed and write stages.
+
+Parsing runs on a process pool, embedding is batched across documents and writes go to
+Postgres and Qdrant in bulk; stages are connected by bounded queues so each stays busy.
+
+Usage: python batch_ingest.py <directory|manifest.txt> [--parse-workers 4] [--force] [--fair]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pdf_extractor import extract_document
+from process_pdf import (
+    get_file_hash, image_dir, find_ingested_document, load_page_index, stage_document,
+    write_documents, staged_result, apply_fair_metadata, purge_orphan_points
+)
+from db_setup import db_connection
+from qdrant_setup import get_qdrant_client
+from qdrant_writer import QdrantWriter
+import embedding_service
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PARSE_WORKERS = int(os.getenv('BATCH_PARSE_WORKERS', str(os.cpu_count() or 1)))
+EMBED_CHUNKS = int(os.getenv('BATCH_EMBED_CHUNKS', '512'))
+WRITE_DOCS = int(os.getenv('BATCH_WRITE_DOCS', '16'))
+QUEUE_SIZE = int(os.getenv('BATCH_QUEUE_SIZE', '8'))
+# Only the opening of each paper is kept for the batched FAIR pass.
+FAIR_TEXT_CHARS = int(os.getenv('FAIR_BATCH_CHARS', '3000'))
+
+_DONE = object()
+
+def _log(msg, **kwargs):
+    extra = " ".join(f"{k}={v}" for k, v in kwargs.items()) if kwargs else ""
+    print(f"[BATCH] {msg} {extra}".strip(), flush=True)
+
+def discover_pdfs(source):
+    """PDF paths under a directory, a single PDF, or a manifest with one path per line (# comments allowed)."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith('.pdf'))
+        return sorted(paths)
+    if source.lower().endswith('.pdf'):
+        return [source]
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [line if os.path.isabs(line) else os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+def split_duplicate_names(paths):
+    """Documents are keyed by basename, so reject every path whose basename is shared with another file.
+
+    Returns (kept_paths, rejected) where rejected entries carry the conflicting paths.
+    """
+    by_name = {}
+    for path in paths:
+        paths_for_name = by_name.setdefault(os.path.basename(path), [])
+        # The same file listed twice (e.g. in a manifest) is not a collision.
+        if not any(os.path.realpath(seen) == os.path.realpath(path) for seen in paths_for_name):
+            paths_for_name.append(path)
+    kept, rejected = [], []
+    for filename, name_paths in by_name.items():
+        if len(name_paths) == 1:
+            kept.append(name_paths[0])
+        else:
+            rejected.append({"filename": filename, "stage": "discover", "error": f"basename shared by {', '.join(name_paths)}"})
+    return kept, rejected
+
+def _parse(pdf_path, output_dir):
+    """Process-pool task: one worker per document, so page extraction itself stays serial."""
+    start = time.perf_counter()
+    document = extract_document(pdf_path, workers=1, output_dir=output_dir)
+    return document, time.perf_counter() - start
+
+class BatchIngestor:
+    def __init__(self, parse_workers=None, embed_chunks=None, write_docs=None, queue_size=None, force=False, fair=False):
+        self.parse_workers = parse_workers or PARSE_WORKERS
+        self.embed_chunks = embed_chunks or EMBED_CHUNKS
+        self.write_docs = write_docs or WRITE_DOCS
+        self.parsed = queue.Queue(maxsize=queue_size or QUEUE_SIZE)
+        self.embedded = queue.Queue(maxsize=queue_size or QUEUE_SIZE)
+        self.force = force
+        self.fair = fair
+        self.qdrant = get_qdrant_client()
+        self.collection_name = os.getenv('QDRANT_COLLECTION', 'pdf_documents')
+        self.writer = QdrantWriter(self.qdrant, self.collection_name)
+        self.busy = {"parse": 0.0, "embed": 0.0, "write": 0.0}
+        self.results = []
+        self.deduplicated = []
+        self.failed = []
+        self.fair_papers = []
+        self._run_hashes = {}
+        self._held = {}
+        self._written_hashes = set()
+        self._lock = threading.Lock()
+
+    def _fail(self, filename, stage, error):
+        _log("failed", file=filename, stage=stage, error=error)
+        with self._lock:
+            self.failed.append({"filename": filename, "stage": stage, "error": str(error)})
+
+    def _prepare(self, pdf_path):
+        """Hash the file and check for a completed identical ingest before paying for a parse."""
+        filename = os.path.basename(pdf_path)
+        file_size = os.path.getsize(pdf_path)
+        file_hash = get_file_hash(pdf_path)
+        # The database check cannot see documents of this run that are not written yet, so copies
+        # of a file already in the pipeline are held until _release_held() knows how it ended.
+        if file_hash in self._run_hashes:
+            self._held.setdefault(file_hash, []).append(pdf_path)
+            return None, None
+        with db_connection() as conn:
+            cur = conn.cursor()
+            if not self.force:
+                existing = find_ingested_document(cur, file_hash, filename)
+                if existing:
+                    return None, existing
+            stored_pages = load_page_index(cur, filename)
+        self._run_hashes[file_hash] = filename
+        return (filename, file_hash, file_size, stored_pages), None
+
+    def _collect(self, future, job):
+        filename, file_hash, file_size, stored_pages = job
+        try:
+            document, elapsed = future.result()
+            self.busy["parse"] += elapsed
+            staged = stage_document(filename, document, stored_pages, force=self.force)
+        except Exception as e:
+            self._fail(filename, "parse", e)
+            return
+        if self.fair:
+            text = "\n\n".join(item['text'] for item in document['texts'])[:FAIR_TEXT_CHARS]
+            if text:
+                self.fair_papers.append({"filename": filename, "text": text, "pdf_info": document['metadata']})
+        # Blocks while the embed stage is behind; this is what bounds memory.
+        self.parsed.put((staged, file_hash, file_size))
+
+    def _parse_stage(self, paths):
+        context = multiprocessing.get_context('spawn')
+        in_flight = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=context) as pool:
+                for pdf_path in paths:
+                    try:
+                        job, existing = self._prepare(pdf_path)
+                    except Exception as e:
+                        self._fail(os.path.basename(pdf_path), "prepare", e)
+                        continue
+                    if existing:
+                        with self._lock:
+                            self.deduplicated.append(existing)
+                        continue
+                    if job is None:
+                        continue
+                    in_flight[pool.submit(_parse, pdf_path, image_dir(job[1]))] = job
+                    if len(in_flight) >= self.parse_workers * 2:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._collect(future, in_flight.pop(future))
+                for future in list(in_flight):
+                    self._collect(future, in_flight.pop(future))
+        finally:
+            self.parsed.put(_DONE)
+
+    def _embed_stage(self):
+        finished = False
+        while not finished:
+            batch = [self.parsed.get()]
+            if batch[0] is _DONE:
+                break
+            chunk_count = len(batch[0][0]['chunks'])
+            # Take whatever else is already parsed, up to the chunk budget, so documents share encode batches.
+            while chunk_count < self.embed_chunks:
+                try:
+                    item = self.parsed.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                batch.append(item)
+                chunk_count += len(item[0]['chunks'])
+            start = time.perf_counter()
+            try:
+                vectors = embedding_service.embed_texts([
+                    chunk['embed_text'] for staged, _, _ in batch for chunk in staged['chunks']
+                ])
+            except Exception as e:
+                for staged, _, _ in batch:
+                    self._fail(staged['filename'], "embed", e)
+                continue
+            finally:
+                self.busy["embed"] += time.perf_counter() - start
+            offset = 0
+            for staged, file_hash, file_size in batch:
+                count = len(staged['chunks'])
+                self.embedded.put((staged, vectors[offset:offset + count], file_hash, file_size))
+                offset += count
+        self.embedded.put(_DONE)
+
+    def _write_stage(self):
+        finished = False
+        while not finished:
+            items = [self.embedded.get()]
+            if items[0] is _DONE:
+                break
+            while len(items) < self.write_docs:
+                try:
+                    item = self.embedded.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                items.append(item)
+            start = time.perf_counter()
+            try:
+                written = self._write_items(items)
+            finally:
+                self.busy["write"] += time.perf_counter() - start
+            with self._lock:
+                self.results.extend(staged_result(staged, file_hash, file_size) for staged, _, file_hash, file_size in written)
+                self._written_hashes.update(file_hash for _, _, file_hash, _ in written)
+            _log("written", docs=len(written), total=len(self.results))
+
+    def _write_items(self, items):
+        """Write a group in one transaction; if it fails, retry each document alone so one bad file fails only itself."""
+        try:
+            write_documents(self.writer, items)
+            return items
+        except Exception as e:
+            if len(items) == 1:
+                self._fail(items[0][0]['filename'], "write", e)
+                return []
+            _log("group write failed; retrying documents one by one", docs=len(items), error=e)
+        written = []
+        for item in items:
+            try:
+                write_documents(self.writer, [item])
+            except Exception as e:
+                self._fail(item[0]['filename'], "write", e)
+                continue
+            written.append(item)
+        return written
+
+    def _release_held(self):
+        """Report held copies of written files as deduplicated; return the copies of failed ones to ingest next."""
+        requeue = []
+        for file_hash, held_paths in self._held.items():
+            if file_hash in self._written_hashes:
+                self.deduplicated.extend(
+                    {"status": "success", "filename": self._run_hashes[file_hash],
+                     "duplicate": os.path.basename(path), "deduplicated": True}
+                    for path in held_paths
+                )
+            else:
+                del self._run_hashes[file_hash]
+                requeue.extend(held_paths)
+        self._held = {}
+        if requeue:
+            _log("requeueing copies of failed files", documents=len(requeue))
+        return requeue
+
+    def _run_pipeline(self, paths):
+        threads = [
+            threading.Thread(target=self._parse_stage, args=(paths,), name="batch-parse"),
+            threading.Thread(target=self._embed_stage, name="batch-embed"),
+            threading.Thread(target=self._write_stage, name="batch-write")
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _extract_fair(self):
+        # Imported lazily: FAIR extraction is opt-in and pulls in the LLM stack.
+        from fair_extractor import extract_fair_metadata_batch
+        ingested = {result['filename'] for result in self.results}
+        papers = [paper for paper in self.fair_papers if paper['filename'] in ingested]
+        fair_results = extract_fair_metadata_batch(papers)
+        apply_fair_metadata(self.qdrant, self.collection_name, fair_results)
+        return len(fair_results)
+
+    def run(self, paths):
+        start = time.perf_counter()
+        documents = len(paths)
+        paths, rejected = split_duplicate_names(paths)
+        for entry in rejected:
+            self._fail(entry["filename"], entry["stage"], entry["error"])
+        try:
+            purge_orphan_points(self.qdrant, self.collection_name)
+        except Exception as e:
+            _log("orphan purge failed", error=e)
+        while paths:
+            self._run_pipeline(paths)
+            paths = self._release_held()
+        self.writer.close()
+        wall = time.perf_counter() - start
+
+        summary = {
+            "documents": documents,
+            "ingested": len(self.results),
+            "deduplicated": len(self.deduplicated),
+            "failed": self.failed,
+            "points": sum(result['points'] for result in self.results),
+            "wall_seconds": round(wall, 2),
+            "docs_per_minute": round(len(self.results) / wall * 60, 1) if wall else None,
+            "qdrant": self.writer.stats(),
+            "stage_busy_seconds": {stage: round(seconds, 2) for stage, seconds in self.busy.items()},
+            # Parse utilisation is relative to all pool workers; the other stages are single threads.
+            "stage_utilisation": {
+                "parse": round(self.busy["parse"] / (wall * self.parse_workers), 3) if wall else None,
+                "embed": round(self.busy["embed"] / wall, 3) if wall else None,
+                "write": round(self.busy["write"] / wall, 3) if wall else None
+            }
+        }
+        if self.fair and self.results:
+            summary["fair_extracted"] = self._extract_fair()
+        _log("done", docs_per_minute=summary["docs_per_minute"], **{f"{k}_util": v for k, v in summary["stage_utilisation"].items()})
+        return summary
+
+def ingest(paths, force=False, fair=False, parse_workers=None):
+    print(f"[EMBEDDING] {embedding_service.warm_up()}", flush=True)
+    return BatchIngestor(parse_workers=parse_workers, force=force, fair=fair).run(paths)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of PDFs, a single PDF, or a manifest file with one path per line")
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Re-ingest files whose hash is already stored")
+    parser.add_argument("--fair", action="store_true", help="Run batched FAIR extraction after ingestion")
+    args = parser.parse_args()
+    paths = discover_pdfs(args.source)
+    _log("starting", documents=len(paths))
+    summary = ingest(paths, force=args.force, fair=args.fair, parse_workers=args.parse_workers)
+    print(json.dumps(summary, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
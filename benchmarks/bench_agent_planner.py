@@ -0,0 +1,73 @@
+"""Count LLM calls per paper for the three ReAct agents with and without planner mode.
+
+A fake LLM answers every tool prompt with passing scores and every reasoning prompt
+with FINISH after a few tool calls, so no API key or network is needed.
+
+Usage: python benchmarks/bench_agent_planner.py [--papers 5] [--quality 0.9]
+"""
+import argparse
+import json
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+import react_agents
+
+Response = namedtuple("Response", ["content", "cached"])
+
+class FakeLLM:
+    def __init__(self, quality, reasoning_steps=4):
+        self.quality = quality
+        self.reasoning_steps = reasoning_steps
+        self.reasoning_calls = 0
+        self.tool_calls = 0
+        self._turn = 0
+
+    def invoke(self, messages, bypass_cache=False):
+        if isinstance(messages, str):
+            self.reasoning_calls += 1
+            self._turn += 1
+            if self._turn >= self.reasoning_steps:
+                self._turn = 0
+                return Response("Thought: metadata is complete\nAction: FINISH\nAction Input:", False)
+            return Response("Thought: check quality\nAction: assess_quality\nAction Input: {}", False)
+        self.tool_calls += 1
+        return Response(json.dumps({
+            "title": "Sample paper",
+            "is_valid": True,
+            "completeness_score": self.quality,
+            "quality_score": self.quality
+        }), False)
+
+def run(planner, papers, quality):
+    fake = FakeLLM(quality)
+    react_agents.llm = fake
+    agents = [
+        (react_agents.create_metadata_extraction_agent(), 6),
+        (react_agents.create_curation_agent(), 10),
+        (react_agents.create_quality_agent(), 8)
+    ]
+    for _ in range(papers):
+        fake._turn = 0
+        for agent, max_iterations in agents:
+            agent.use_planner = planner
+            agent.llm = fake
+            agent.run({"text": "Sample physics paper text.", "metadata": {}}, max_iterations=max_iterations)
+    total = fake.reasoning_calls + fake.tool_calls
+    print(f"planner={'on ' if planner else 'off'} reasoning/paper={fake.reasoning_calls / papers:.1f} "
+          f"tool/paper={fake.tool_calls / papers:.1f} total/paper={total / papers:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, default=5)
+    parser.add_argument("--quality", type=float, default=0.9, help="Score the fake LLM reports for every check")
+    args = parser.parse_args()
+    run(False, args.papers, args.quality)
+    run(True, args.papers, args.quality)
+
+if __name__ == "__main__":
+    main()
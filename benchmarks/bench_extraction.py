@@ -0,0 +1,51 @@
+"""Compare pages/sec of the legacy multi-open extraction against the single-pass engine.
+
+Usage: python benchmarks/bench_extraction.py paper.pdf [more.pdf ...] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pdfplumber
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pdf_extractor import extract_text, extract_tables, extract_images, extract_document
+
+def legacy_extract(pdf_path, output_dir):
+    # The pre-engine ingest path: metadata, text, tables and images each open the file.
+    with pdfplumber.open(pdf_path) as pdf:
+        total_pages = len(pdf.pages)
+    extract_text(pdf_path)
+    extract_tables(pdf_path)
+    extract_images(pdf_path, output_dir=output_dir)
+    return total_pages
+
+def single_pass_extract(pdf_path, output_dir):
+    return extract_document(pdf_path, output_dir=output_dir)['total_pages']
+
+def run(label, func, pdf_paths, repeat):
+    best = None
+    pages = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_dir:
+            start = time.perf_counter()
+            pages = sum(func(path, output_dir) for path in pdf_paths)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<12} pages={pages} best={best:.2f}s pages/sec={pages / best:.1f}")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("pdf_paths", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    before = run("legacy", legacy_extract, args.pdf_paths, args.repeat)
+    after = run("single-pass", single_pass_extract, args.pdf_paths, args.repeat)
+    print(f"speedup: {before / after:.2f}x")
+
+if __name__ == "__main__":
+    main()
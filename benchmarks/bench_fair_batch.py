@@ -0,0 +1,53 @@
+"""Compare LLM requests and wall time for per-paper vs batched FAIR extraction.
+
+Uses the offline mock model (LLM_PROVIDER=mock) unless --live is given; nothing is stored.
+Usage: python benchmarks/bench_fair_batch.py [--papers 40] [--batch-size 8] [--live]
+"""
+import argparse
+import os
+import sys
+import time
+
+def make_papers(count):
+    return [
+        {
+            "filename": f"paper_{i:04d}.pdf",
+            "text": f"Measurement of observable {i} in proton collisions\n"
+                    f"Abstract. We report a measurement of observable {i}.\n"
+                    + "Body text of the paper. " * 400
+        }
+        for i in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, default=40)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--live", action="store_true", help="Call the configured OpenAI model instead of the mock")
+    args = parser.parse_args()
+
+    if not args.live:
+        os.environ["LLM_PROVIDER"] = "mock"
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import fair_extractor
+    from llm_client import llm
+
+    papers = make_papers(args.papers)
+
+    start = time.perf_counter()
+    for paper in papers:
+        fair_extractor.extract_fair_metadata(paper["text"])
+    single_time = time.perf_counter() - start
+    single_calls = llm.calls
+
+    start = time.perf_counter()
+    results = fair_extractor.extract_fair_metadata_batch(papers, batch_size=args.batch_size)
+    batch_time = time.perf_counter() - start
+    batch_calls = llm.calls - single_calls
+
+    print(f"per-paper: requests={single_calls} time={single_time:.2f}s")
+    print(f"batched:   requests={batch_calls} time={batch_time:.2f}s results={len(results)} batch_size={args.batch_size}")
+
+if __name__ == "__main__":
+    main()
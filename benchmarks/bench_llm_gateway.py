@@ -0,0 +1,35 @@
+"""Fire concurrent chat completions through the LLM gateway and report throughput, retries and latency.
+
+Start benchmarks/fake_openai_server.py first (or point OPENAI_BASE_URL at a real endpoint).
+Usage: python benchmarks/bench_llm_gateway.py [--base-url http://localhost:8900/v1] [--requests 200] [--threads 32]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8900/v1")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32, help="Caller threads; the gateway caps in-flight requests")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = args.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from llm_client import llm
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(lambda i: llm.invoke(f"Extract metadata from paper {i}"), range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"requests={args.requests} time={elapsed:.2f}s throughput={args.requests / elapsed:.1f}/s")
+    print(json.dumps(llm.gateway.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Scaling benchmark for process-pool page extraction across 1/2/4/8 workers.
+
+Usage: python benchmarks/bench_parallel_extraction.py thesis.pdf [--workers 1 2 4 8] [--repeat 2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pdf_extractor
+from pdf_extractor import extract_document
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("pdf_path")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    # Benchmark the pool even on short inputs.
+    pdf_extractor.PARALLEL_MIN_PAGES = 1
+
+    baseline = None
+    for workers in args.workers:
+        best = None
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as output_dir:
+                start = time.perf_counter()
+                document = extract_document(args.pdf_path, output_dir=output_dir, workers=workers)
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        baseline = baseline or best
+        pages = document['total_pages']
+        print(f"workers={workers:<2} pages={pages} best={best:.2f}s "
+              f"pages/sec={pages / best:.1f} speedup={baseline / best:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare rows/sec for per-row INSERTs against execute_values and COPY into pdf_documents.
+
+Runs against the database configured by DB_* env vars; every run is rolled back.
+Usage: python benchmarks/bench_pg_writes.py [--rows 5000] [--batch-size 500]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_setup import get_connection, bulk_insert_documents, DOCUMENT_COLUMNS
+
+def make_rows(count):
+    return [
+        ("bench.pdf", i // 3 + 1, "text", f"Benchmark page text {i} " * 40, None,
+         json.dumps([["a", "b"], ["1", "2"]]) if i % 10 == 0 else None,
+         str(uuid.uuid4()), "0" * 64)
+        for i in range(count)
+    ]
+
+def per_row(cur, rows, batch_size):
+    for row in rows:
+        cur.execute(f"""
+            INSERT INTO pdf_documents ({', '.join(DOCUMENT_COLUMNS)})
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, row)
+
+def values(cur, rows, batch_size):
+    bulk_insert_documents(cur, rows, page_size=batch_size)
+
+def copy(cur, rows, batch_size):
+    def field(value):
+        if value is None:
+            return "\\N"
+        return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(field(v) for v in row) + "\n")
+    buffer.seek(0)
+    cur.copy_from(buffer, "pdf_documents", columns=DOCUMENT_COLUMNS)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    conn = get_connection()
+    try:
+        for label, writer in (("execute", per_row), ("execute_values", values), ("copy", copy)):
+            cur = conn.cursor()
+            start = time.perf_counter()
+            writer(cur, rows, args.batch_size)
+            elapsed = time.perf_counter() - start
+            conn.rollback()
+            print(f"{label:<15} rows={len(rows)} {elapsed:.2f}s rows/sec={len(rows) / elapsed:.0f}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
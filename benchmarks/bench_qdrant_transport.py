@@ -0,0 +1,73 @@
+"""Compare REST and gRPC Qdrant clients on upsert and search throughput against a local instance.
+
+Uses a throwaway collection that is dropped afterwards; QDRANT_URL and QDRANT_GRPC_PORT select the server.
+Usage: python benchmarks/bench_qdrant_transport.py [--points 20000] [--batch-size 256] [--searches 500] [--threads 8]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def _vectors(count, dim, rng):
+    return [[rng.uniform(-1, 1) for _ in range(dim)] for _ in range(count)]
+
+def bench_transport(label, client, args, points, queries):
+    from qdrant_client.models import Batch, Distance, VectorParams
+
+    collection = f"{args.collection}_{label}"
+    client.recreate_collection(collection_name=collection, vectors_config=VectorParams(size=args.dim, distance=Distance.COSINE))
+    try:
+        batches = [
+            (list(range(i, min(i + args.batch_size, len(points)))), points[i:i + args.batch_size])
+            for i in range(0, len(points), args.batch_size)
+        ]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(lambda batch: client.upsert(
+                collection_name=collection,
+                points=Batch(ids=batch[0], vectors=batch[1], payloads=[{"i": i} for i in batch[0]]),
+                wait=True
+            ), batches))
+        upsert_seconds = time.perf_counter() - start
+
+        def timed_search(vector):
+            t = time.perf_counter()
+            client.search(collection_name=collection, query_vector=vector, limit=args.limit, with_payload=True)
+            return (time.perf_counter() - t) * 1000
+
+        timed_search(queries[0])
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            timings = sorted(executor.map(timed_search, queries))
+        search_seconds = time.perf_counter() - start
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        print(f"{label:<5} upsert={len(points) / upsert_seconds:,.0f} points/s  "
+              f"search={len(queries) / search_seconds:,.0f} q/s median={statistics.median(timings):.1f}ms p95={p95:.1f}ms")
+    finally:
+        client.delete_collection(collection_name=collection)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--collection", default="bench_transport")
+    args = parser.parse_args()
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from qdrant_setup import new_qdrant_client
+
+    rng = random.Random(0)
+    points = _vectors(args.points, args.dim, rng)
+    queries = _vectors(args.searches, args.dim, rng)
+    for label, prefer_grpc in (("rest", False), ("grpc", True)):
+        bench_transport(label, new_qdrant_client(prefer_grpc=prefer_grpc), args, points, queries)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Measure GET /search latency for limit=5/50/200 against a running API.
+
+Usage: python benchmarks/bench_search.py [--url http://localhost:8005] [--query "dark matter"] [--runs 20]
+"""
+import argparse
+import statistics
+import time
+import urllib.parse
+import urllib.request
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8005")
+    parser.add_argument("--query", default="quantum field theory")
+    parser.add_argument("--limits", type=int, nargs="+", default=[5, 50, 200])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    for limit in args.limits:
+        url = f"{args.url}/search?" + urllib.parse.urlencode({"query": args.query, "limit": limit})
+        urllib.request.urlopen(url).read()
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            urllib.request.urlopen(url).read()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        print(f"limit={limit:<4} median={statistics.median(timings):.1f}ms p95={p95:.1f}ms")
+
+if __name__ == "__main__":
+    main()
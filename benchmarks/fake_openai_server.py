@@ -0,0 +1,74 @@
+"""Minimal OpenAI-compatible chat completions server for exercising the LLM gateway offline.
+
+Answers POST /v1/chat/completions after --latency seconds with a small JSON completion,
+returns 429 (with Retry-After) for every --rate-limit-every'th request and 500 for every
+--error-every'th one. Point the app at it with OPENAI_BASE_URL=http://localhost:8900/v1.
+
+Usage: python benchmarks/fake_openai_server.py [--port 8900] [--latency 0.2] [--rate-limit-every 0] [--error-every 0]
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def make_handler(args):
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with lock:
+                n = next(counter)
+            if args.rate_limit_every and n % args.rate_limit_every == 0:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                           {"Retry-After": str(args.retry_after)})
+                return
+            if args.error_every and n % args.error_every == 0:
+                self._send(500, {"error": {"message": "Internal error", "type": "server_error"}})
+                return
+            time.sleep(args.latency)
+            prompt = " ".join(str(message.get("content", "")) for message in request.get("messages", []))
+            content = json.dumps({"title": f"Fake paper {n}", "is_valid": True, "completeness_score": 0.9, "quality_score": 0.9})
+            self._send(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4}
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--error-every", type=int, default=0)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(args))
+    print(f"fake OpenAI server on http://localhost:{args.port}/v1", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,16 @@
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from db_setup import get_connection
+from llm_client import llm
+from db_setup import db_connection
 from fair_extractor import log_provenance
+import metadata_validator
 import json
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-llm = ChatOpenAI(
-    model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-    temperature=0,
-    api_key=os.getenv('OPENAI_API_KEY')
-)
-
-def validate_metadata(fair_data):
+def validate_metadata(fair_data, semantic=None):
     print(f"[CURATION] validate_metadata called", flush=True)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """Validate FAIR metadata for completeness and correctness. Return JSON with:
-- is_valid: boolean
-- missing_fields: list of required missing fields
-- errors: list of validation errors
-- warnings: list of warnings
-- completeness_score: float 0-1"""),
-        ("human", "Validate metadata:\n\n{metadata}")
-    ])
-    
-    messages = prompt.format_messages(metadata=json.dumps(fair_data, indent=2))
-    response = llm.invoke(messages)
-    
-    try:
-        return json.loads(response.content)
-    except:
-        return {"is_valid": False, "errors": ["Validation failed"]}
+    return metadata_validator.validate(fair_data, semantic=semantic)
 
 def enrich_metadata(fair_data, pdf_text):
     print(f"[CURATION] enrich_metadata called text_len={len(pdf_text)}", flush=True)
@@ -99,27 +77,24 @@ def resolve_conflicts(fair_data, existing_data):
 
 def update_curation_status(filename, status, quality_score=None, validation_status=None):
     print(f"[CURATION] update_curation_status file={filename} status={status} quality_score={quality_score} validation_status={validation_status}", flush=True)
-    conn = get_connection()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
 
-    update_fields = ["curation_status = %s"]
-    values = [status]
-    
-    if quality_score is not None:
-        update_fields.append("quality_score = %s")
-        values.append(quality_score)
+        update_fields = ["curation_status = %s"]
+        values = [status]
     
-    if validation_status:
-        update_fields.append("validation_status = %s")
-        values.append(validation_status)
+        if quality_score is not None:
+            update_fields.append("quality_score = %s")
+            values.append(quality_score)
     
-    values.append(filename)
+        if validation_status:
+            update_fields.append("validation_status = %s")
+            values.append(validation_status)
     
-    cur.execute(f"""
-        UPDATE fair_metadata 
-        SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP
-        WHERE filename = %s
-    """, values)
+        values.append(filename)
     
-    conn.commit()
-    conn.close()
+        cur.execute(f"""
+            UPDATE fair_metadata 
+            SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP
+            WHERE filename = %s
+        """, values)
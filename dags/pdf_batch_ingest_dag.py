@@ -0,0 +1,84 @@
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+from datetime import datetime, timedelta
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batch_ingest import discover_pdfs, split_duplicate_names, ingest
+
+default_args = {
+    'owner': 'airflow',
+    'depends_on_past': False,
+    'start_date': datetime(2024, 1, 1),
+    'retries': 1,
+    'retry_delay': timedelta(minutes=5),
+}
+
+dag = DAG(
+    'pdf_batch_ingest',
+    default_args=default_args,
+    description='Ingest a directory or manifest of PDFs in parallel shards',
+    schedule_interval=None,
+    catchup=False,
+)
+
+def list_shards_task(**context):
+    conf = context['dag_run'].conf
+    source = conf.get('source')
+    if not source:
+        raise ValueError("source (directory or manifest path) must be provided in DAG run configuration")
+    shard_size = int(conf.get('shard_size', 200))
+    # Shards run independently, so basename collisions must be rejected before splitting.
+    paths, rejected = split_duplicate_names(discover_pdfs(source))
+    context['ti'].xcom_push(key='rejected', value=rejected)
+    print(f"[BATCH] {len(paths)} PDFs in {source}, {len(rejected)} rejected, shard_size={shard_size}", flush=True)
+    return [
+        {
+            "paths": paths[i:i + shard_size],
+            "force": bool(conf.get('force', False)),
+            "fair": bool(conf.get('fair', False)),
+            "parse_workers": conf.get('parse_workers')
+        }
+        for i in range(0, len(paths), shard_size)
+    ]
+
+def ingest_shard_task(paths, force=False, fair=False, parse_workers=None):
+    return ingest(paths, force=force, fair=fair, parse_workers=int(parse_workers) if parse_workers else None)
+
+def summarize_task(**context):
+    summaries = [s for s in context['ti'].xcom_pull(task_ids='ingest_shard') or [] if s]
+    summary = {
+        "shards": len(summaries),
+        "ingested": sum(s['ingested'] for s in summaries),
+        "deduplicated": sum(s['deduplicated'] for s in summaries),
+        "failed": (context['ti'].xcom_pull(task_ids='list_shards', key='rejected') or [])
+                  + [failure for s in summaries for failure in s['failed']],
+        "points": sum(s['points'] for s in summaries),
+        "docs_per_minute_per_shard": [s['docs_per_minute'] for s in summaries]
+    }
+    print(f"[BATCH] {summary}", flush=True)
+    return summary
+
+list_shards = PythonOperator(
+    task_id='list_shards',
+    python_callable=list_shards_task,
+    dag=dag,
+)
+
+# One mapped task instance per shard; each runs the pipelined parse/embed/write ingestor.
+ingest_shard = PythonOperator.partial(
+    task_id='ingest_shard',
+    python_callable=ingest_shard_task,
+    max_active_tis_per_dag=int(os.getenv('BATCH_INGEST_MAX_SHARDS', '2')),
+    dag=dag,
+).expand(op_kwargs=list_shards.output)
+
+summarize = PythonOperator(
+    task_id='summarize',
+    python_callable=summarize_task,
+    trigger_rule='all_done',
+    dag=dag,
+)
+
+list_shards >> ingest_shard >> summarize
@@ -6,6 +6,7 @@ import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from process_pdf import process_pdf
+import embedding_service
 
 default_args = {
     'owner': 'airflow',
@@ -27,7 +28,10 @@ def extract_pdf_task(**context):
     pdf_path = context['dag_run'].conf.get('pdf_path')
     if not pdf_path:
         raise ValueError("pdf_path must be provided in DAG run configuration")
-    return process_pdf(pdf_path)
+    print(f"[EMBEDDING] {embedding_service.warm_up()}", flush=True)
+    workers = context['dag_run'].conf.get('workers')
+    force = bool(context['dag_run'].conf.get('force', False))
+    return process_pdf(pdf_path, workers=int(workers) if workers else None, force=force)
 
 extract_task = PythonOperator(
     task_id='extract_and_store_pdf',
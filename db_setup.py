@@ -1,16 +1,116 @@
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from contextlib import contextmanager
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Connections idle longer than this are pinged before being handed out.
+POOL_HEALTHCHECK_IDLE = float(os.getenv('DB_POOL_HEALTHCHECK_IDLE', '30'))
+
+def _connection_params():
+    return {
+        "host": os.getenv('DB_HOST', 'localhost'),
+        "database": os.getenv('DB_NAME', 'pdf_store'),
+        "user": os.getenv('DB_USER', 'postgres'),
+        "password": os.getenv('DB_PASSWORD', 'postgres'),
+        "port": os.getenv('DB_PORT', '5432')
+    }
+
 def get_connection():
-    return psycopg2.connect(
-        host=os.getenv('DB_HOST', 'localhost'),
-        database=os.getenv('DB_NAME', 'pdf_store'),
-        user=os.getenv('DB_USER', 'postgres'),
-        password=os.getenv('DB_PASSWORD', 'postgres'),
-        port=os.getenv('DB_PORT', '5432')
+    """Open a dedicated (unpooled) connection; prefer db_connection() for request paths."""
+    return psycopg2.connect(**_connection_params())
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_last_used = {}
+
+def get_pool():
+    """Return this process's ThreadedConnectionPool, recreating it after a fork."""
+    global _pool, _pool_pid, _pool_slots
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadedConnectionPool(POOL_MIN, POOL_MAX, **_connection_params())
+                _pool_slots = threading.BoundedSemaphore(POOL_MAX)
+                _pool_pid = os.getpid()
+                _last_used.clear()
+    return _pool
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < POOL_HEALTHCHECK_IDLE:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _checkout(pool):
+    conn = pool.getconn()
+    if not _is_healthy(conn):
+        pool.putconn(conn, close=True)
+        _last_used.pop(id(conn), None)
+        conn = pool.getconn()
+    return conn
+
+@contextmanager
+def db_connection():
+    """Check a pooled connection out: commit on success, roll back on error, always return it."""
+    pool = get_pool()
+    slots = _pool_slots
+    # ThreadedConnectionPool raises instead of waiting when exhausted; block on a slot first.
+    if not slots.acquire(timeout=POOL_TIMEOUT):
+        raise PoolError(f"no database connection available after {POOL_TIMEOUT}s")
+    try:
+        conn = _checkout(pool)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            if conn.closed:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        slots.release()
+
+DOCUMENT_COLUMNS = (
+    "filename", "page_number", "content_type", "content",
+    "image_path", "table_data", "qdrant_id", "page_hash"
+)
+
+def bulk_insert_documents(cur, rows, page_size=None):
+    """Write staged pdf_documents rows (tuples in DOCUMENT_COLUMNS order) as multi-row INSERTs."""
+    if not rows:
+        return
+    page_size = page_size or int(os.getenv('PG_BATCH_SIZE', '500'))
+    execute_values(
+        cur,
+        f"INSERT INTO pdf_documents ({', '.join(DOCUMENT_COLUMNS)}) VALUES %s",
+        rows,
+        page_size=page_size
     )
 
 def setup_database():
@@ -27,10 +127,13 @@ def setup_database():
             image_path VARCHAR(500),
             table_data JSONB,
             qdrant_id VARCHAR(255),
+            page_hash VARCHAR(64),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """)
     
+    cur.execute("ALTER TABLE pdf_documents ADD COLUMN IF NOT EXISTS page_hash VARCHAR(64);")
+    
     cur.execute("""
         CREATE TABLE IF NOT EXISTS pdf_metadata (
             id SERIAL PRIMARY KEY,
@@ -91,10 +194,41 @@ def setup_database():
         );
     """)
     
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id UUID PRIMARY KEY,
+            filename VARCHAR(255),
+            file_path VARCHAR(500),
+            use_agent BOOLEAN DEFAULT FALSE,
+            options JSONB,
+            status VARCHAR(50) DEFAULT 'queued',
+            stage VARCHAR(50),
+            result JSONB,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+    """)
+    
+    cur.execute("ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0;")
+    
+    # Qdrant points left behind when their post-commit delete failed; purged by process_pdf.purge_orphan_points.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS qdrant_orphans (
+            qdrant_id VARCHAR(255) PRIMARY KEY,
+            filename VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_filename ON ingest_jobs(filename);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_provenance_filename ON provenance(filename);")
     
     cur.execute("CREATE INDEX IF NOT EXISTS idx_filename ON pdf_documents(filename);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_documents_qdrant_id ON pdf_documents(qdrant_id);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_metadata_filename ON pdf_metadata(filename);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_metadata_file_hash ON pdf_metadata(file_hash);")
     
     conn.commit()
     conn.close()
@@ -0,0 +1,86 @@
+from sentence_transformers import SentenceTransformer
+import numpy as np
+import os
+import threading
+import time
+from embedding_cache import cache_enabled, chunk_key, get_embedding_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+_model = None
+_lock = threading.Lock()
+_metrics = {
+    "model_name": MODEL_NAME,
+    "loaded": False,
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "encode_calls": 0
+}
+
+def get_encoder():
+    """Return the process-wide SentenceTransformer, loading it on first use."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                start = time.perf_counter()
+                model = SentenceTransformer(MODEL_NAME)
+                _metrics["load_seconds"] = round(time.perf_counter() - start, 3)
+                _metrics["loaded"] = True
+                print(f"[EMBEDDING] loaded {MODEL_NAME} in {_metrics['load_seconds']}s", flush=True)
+                _model = model
+    return _model
+
+def warm_up():
+    """Load the model and run one encode so the first real request is not slowed down."""
+    model = get_encoder()
+    if _metrics["warmup_seconds"] is None:
+        start = time.perf_counter()
+        model.encode(["warm-up"])
+        _metrics["warmup_seconds"] = round(time.perf_counter() - start, 3)
+    return get_metrics()
+
+def encode(sentences, **kwargs):
+    _metrics["encode_calls"] += 1
+    return get_encoder().encode(sentences, **kwargs)
+
+def _encode_batches(texts, batch_size):
+    _metrics["encode_calls"] += 1
+    vectors = get_encoder().encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+    return np.asarray(vectors, dtype=np.float32)
+
+def embed_texts(texts, batch_size=None, use_cache=True):
+    """Encode a list of strings in batches and return a float32 matrix (one row per text).
+
+    Chunks already in the embedding cache are not re-encoded.
+    """
+    batch_size = batch_size or int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+    if not texts:
+        return np.zeros((0, get_encoder().get_sentence_embedding_dimension()), dtype=np.float32)
+    if not (use_cache and cache_enabled()):
+        return _encode_batches(texts, batch_size)
+
+    cache = get_embedding_cache()
+    keys = [chunk_key(text) for text in texts]
+    vectors = cache.get_many(MODEL_NAME, keys)
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors and key not in missing:
+            missing[key] = text
+    if missing:
+        encoded = _encode_batches(list(missing.values()), batch_size)
+        new_vectors = dict(zip(missing.keys(), encoded))
+        cache.put_many(MODEL_NAME, new_vectors)
+        vectors.update(new_vectors)
+
+    return np.vstack([vectors[key] for key in keys])
+
+def get_metrics():
+    metrics = dict(_metrics)
+    if cache_enabled():
+        metrics["cache"] = get_embedding_cache().stats()
+    return metrics
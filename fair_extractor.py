@@ -1,96 +1,186 @@
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
+from llm_client import llm
 from langchain.schema import HumanMessage
-from db_setup import get_connection
+from db_setup import db_connection
+from psycopg2.extras import execute_values
+from llm_gateway import MAX_CONCURRENCY
+from concurrent.futures import ThreadPoolExecutor
+from header_extractor import extract_header_fields, merge_extracted, satisfies, skip_llm_fields, split_hints
 import json
+import psycopg2
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-llm = ChatOpenAI(
-    model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-    temperature=0,
-    api_key=os.getenv('OPENAI_API_KEY')
-)
+FAIR_FIELDS = {
+    "doi": "Digital Object Identifier (if present)",
+    "handle": "Handle identifier (if present)",
+    "ark": "ARK identifier (if present)",
+    "title": "Paper title",
+    "authors": "List of author objects with name, affiliation, orcid",
+    "abstract": "Abstract text",
+    "keywords": "List of keywords",
+    "publication_date": "Publication date (YYYY-MM-DD)",
+    "journal": "Journal name with ISSN",
+    "license": "License type (CC-BY, etc.)",
+    "repository_url": "Data/code repository URL",
+    "data_availability": "Data availability statement",
+    "methodology": "Brief methodology description",
+    "citation_info": "Citation format",
+    "pacs_codes": "Physics and Astronomy Classification Scheme codes",
+    "mesh_terms": "Medical Subject Headings terms (if applicable)",
+    "subject_classifications": "Subject area classifications",
+    "datacite_schema": "Full DataCite 4.4 schema fields (resourceType, publisher, language, etc.)",
+    "metadata_schema": "Schema used (DataCite)"
+}
+
+def extract_fair_metadata(pdf_text, pdf_info=None, skip_fields=None):
+    """LLM FAIR extraction seeded with identifiers found locally in the header and PDF info dict.
+
+    When every field in skip_fields (default FAIR_SKIP_LLM_FIELDS) was found locally the LLM is not called.
+    """
+    known = extract_header_fields(pdf_text, pdf_info)
+    if skip_fields is None:
+        skip_fields = skip_llm_fields()
+    if satisfies(known, skip_fields):
+        print(f"[FAIR] header pre-extraction satisfied {','.join(skip_fields)}; skipping LLM", flush=True)
+        return {**known, "metadata_schema": "DataCite"}
 
-def extract_fair_metadata(pdf_text):
+    # Identifiers are passed as facts and dropped from the field list the model must fill;
+    # info-dict title and keywords stay in it and are only offered as hints.
+    identifiers, hints = split_hints(known)
+    remaining = "\n".join(f"- {field}: {description}" for field, description in FAIR_FIELDS.items() if not identifiers.get(field))
+    facts = ""
+    if identifiers:
+        facts += "\n\nKnown facts found verbatim in the paper (do not repeat them):\n" + json.dumps(identifiers, ensure_ascii=False)
+    if hints:
+        facts += "\n\nHints from the PDF document info (may be wrong; prefer the paper text):\n" + json.dumps(hints, ensure_ascii=False)
     prompt = ChatPromptTemplate.from_messages([
-        ("system", """Extract full DataCite-compliant FAIR metadata from physics research paper. Return JSON with:
-- doi: Digital Object Identifier (if present)
-- handle: Handle identifier (if present)
-- ark: ARK identifier (if present)
-- title: Paper title
-- authors: List of author objects with name, affiliation, orcid
-- abstract: Abstract text
-- keywords: List of keywords
-- publication_date: Publication date (YYYY-MM-DD)
-- journal: Journal name with ISSN
-- license: License type (CC-BY, etc.)
-- repository_url: Data/code repository URL
-- data_availability: Data availability statement
-- methodology: Brief methodology description
-- citation_info: Citation format
-- pacs_codes: Physics and Astronomy Classification Scheme codes
-- mesh_terms: Medical Subject Headings terms (if applicable)
-- subject_classifications: Subject area classifications
-- datacite_schema: Full DataCite 4.4 schema fields (resourceType, publisher, language, etc.)
-- metadata_schema: Schema used (DataCite)"""),
-        ("human", "Extract comprehensive metadata from:\n\n{pdf_text}")
+        ("system", "Extract full DataCite-compliant FAIR metadata from physics research paper. Return JSON with:\n{fields}"),
+        ("human", "Extract comprehensive metadata from:\n\n{pdf_text}{facts}")
     ])
     
-    messages = prompt.format_messages(pdf_text=pdf_text[:8000])
+    messages = prompt.format_messages(fields=remaining, pdf_text=pdf_text[:8000], facts=facts)
     response = llm.invoke(messages)
     
     try:
-        return json.loads(response.content)
+        extracted = json.loads(response.content)
     except:
-        return {}
+        extracted = {}
+    if not isinstance(extracted, dict):
+        extracted = {}
+    return merge_extracted(extracted, known)
+
+FAIR_BATCH_SIZE = int(os.getenv('FAIR_BATCH_SIZE', '8'))
+FAIR_BATCH_CHARS = int(os.getenv('FAIR_BATCH_CHARS', '3000'))
+
+def _paper_block(filename, text, known):
+    block = f"=== PAPER: {filename} ===\n{text[:FAIR_BATCH_CHARS]}"
+    identifiers, hints = split_hints(known)
+    if identifiers:
+        block += "\nKnown facts (do not repeat them): " + json.dumps(identifiers, ensure_ascii=False)
+    if hints:
+        block += "\nHints from the PDF document info (may be wrong): " + json.dumps(hints, ensure_ascii=False)
+    return block
+
+def extract_fair_metadata_batch(papers, batch_size=None, skip_fields=None):
+    """FAIR extraction for many papers with several papers packed into each LLM request.
+
+    papers is a list of {"filename", "text", "pdf_info"} dicts; returns {filename: fair_data}.
+    Each response is a JSON object keyed by filename; papers missing from it are retried one by one.
+    """
+    batch_size = batch_size or FAIR_BATCH_SIZE
+    if skip_fields is None:
+        skip_fields = skip_llm_fields()
+    results = {}
+    pending = []
+    for paper in papers:
+        known = extract_header_fields(paper["text"], paper.get("pdf_info"))
+        if satisfies(known, skip_fields):
+            results[paper["filename"]] = {**known, "metadata_schema": "DataCite"}
+        else:
+            pending.append((paper, known))
+
+    fields = "\n".join(f"- {field}: {description}" for field, description in FAIR_FIELDS.items())
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", """Extract full DataCite-compliant FAIR metadata for each physics research paper below.
+Papers are separated by "=== PAPER: <filename> ===" lines. Return one JSON object keyed by the exact filename;
+each value is a JSON object with:
+{fields}"""),
+        ("human", "{papers}")
+    ])
+    def extract_group(group):
+        papers_text = "\n\n".join(_paper_block(paper["filename"], paper["text"], known) for paper, known in group)
+        response = llm.invoke(prompt.format_messages(fields=fields, papers=papers_text))
+        try:
+            extracted = json.loads(response.content)
+        except:
+            extracted = {}
+        if not isinstance(extracted, dict):
+            extracted = {}
+        group_results = {}
+        missing = 0
+        for paper, known in group:
+            fair_data = extracted.get(paper["filename"])
+            if isinstance(fair_data, dict):
+                group_results[paper["filename"]] = merge_extracted(fair_data, known)
+            else:
+                missing += 1
+                group_results[paper["filename"]] = extract_fair_metadata(paper["text"], paper.get("pdf_info"), skip_fields=skip_fields)
+        print(f"[FAIR] batch papers={len(group)} fallbacks={missing}", flush=True)
+        return group_results
+
+    # Groups are sent concurrently; the LLM gateway enforces the concurrency and rate limits.
+    groups = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(len(groups), MAX_CONCURRENCY)) as executor:
+            for group_results in executor.map(extract_group, groups):
+                results.update(group_results)
+    return results
 
 def log_provenance(filename, action, agent, input_data=None, output_data=None, metadata=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO provenance (filename, action, agent, input_data, output_data, metadata)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (filename, action, agent, json.dumps(input_data), json.dumps(output_data), json.dumps(metadata)))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO provenance (filename, action, agent, input_data, output_data, metadata)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (filename, action, agent, json.dumps(input_data), json.dumps(output_data), json.dumps(metadata)))
 
-def store_fair_metadata(filename, fair_data, provenance_info=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        INSERT INTO fair_metadata (
-            filename, doi, handle, ark, title, authors, abstract, keywords, publication_date,
-            journal, license, repository_url, data_availability, methodology,
-            citation_info, pacs_codes, mesh_terms, subject_classifications,
-            metadata_schema, datacite_schema, provenance_chain
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (filename) 
-        DO UPDATE SET
-            doi = EXCLUDED.doi,
-            handle = EXCLUDED.handle,
-            ark = EXCLUDED.ark,
-            title = EXCLUDED.title,
-            authors = EXCLUDED.authors,
-            abstract = EXCLUDED.abstract,
-            keywords = EXCLUDED.keywords,
-            publication_date = EXCLUDED.publication_date,
-            journal = EXCLUDED.journal,
-            license = EXCLUDED.license,
-            repository_url = EXCLUDED.repository_url,
-            data_availability = EXCLUDED.data_availability,
-            methodology = EXCLUDED.methodology,
-            citation_info = EXCLUDED.citation_info,
-            pacs_codes = EXCLUDED.pacs_codes,
-            mesh_terms = EXCLUDED.mesh_terms,
-            subject_classifications = EXCLUDED.subject_classifications,
-            datacite_schema = EXCLUDED.datacite_schema,
-            provenance_chain = EXCLUDED.provenance_chain,
-            updated_at = CURRENT_TIMESTAMP
-    """, (
+FAIR_COLUMNS = (
+    "filename", "doi", "handle", "ark", "title", "authors", "abstract", "keywords", "publication_date",
+    "journal", "license", "repository_url", "data_availability", "methodology",
+    "citation_info", "pacs_codes", "mesh_terms", "subject_classifications",
+    "metadata_schema", "datacite_schema", "provenance_chain"
+)
+
+FAIR_UPSERT = """
+    ON CONFLICT (filename) 
+    DO UPDATE SET
+        doi = EXCLUDED.doi,
+        handle = EXCLUDED.handle,
+        ark = EXCLUDED.ark,
+        title = EXCLUDED.title,
+        authors = EXCLUDED.authors,
+        abstract = EXCLUDED.abstract,
+        keywords = EXCLUDED.keywords,
+        publication_date = EXCLUDED.publication_date,
+        journal = EXCLUDED.journal,
+        license = EXCLUDED.license,
+        repository_url = EXCLUDED.repository_url,
+        data_availability = EXCLUDED.data_availability,
+        methodology = EXCLUDED.methodology,
+        citation_info = EXCLUDED.citation_info,
+        pacs_codes = EXCLUDED.pacs_codes,
+        mesh_terms = EXCLUDED.mesh_terms,
+        subject_classifications = EXCLUDED.subject_classifications,
+        datacite_schema = EXCLUDED.datacite_schema,
+        provenance_chain = EXCLUDED.provenance_chain,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+def _fair_row(filename, fair_data, provenance_info=None):
+    return (
         filename,
         fair_data.get('doi'),
         fair_data.get('handle'),
@@ -112,11 +202,80 @@ def store_fair_metadata(filename, fair_data, provenance_info=None):
         fair_data.get('metadata_schema', 'DataCite'),
         json.dumps(fair_data.get('datacite_schema', {})),
         json.dumps(provenance_info or [])
-    ))
+    )
+
+def store_fair_metadata(filename, fair_data, provenance_info=None):
+    with db_connection() as conn:
+        cur = conn.cursor()
     
-    conn.commit()
-    conn.close()
+        cur.execute(f"""
+            INSERT INTO fair_metadata ({', '.join(FAIR_COLUMNS)})
+            VALUES ({', '.join(['%s'] * len(FAIR_COLUMNS))})
+            {FAIR_UPSERT}
+        """, _fair_row(filename, fair_data, provenance_info))
     
     if provenance_info:
         log_provenance(filename, "store_metadata", "fair_extractor", 
-                      input_data=fair_data, output_data={"status": "stored"})
\ No newline at end of file
+                      input_data=fair_data, output_data={"status": "stored"})
+
+def store_fair_metadata_bulk(records, page_size=None):
+    """Upsert {filename: fair_data} with multi-row INSERTs; falls back to per-row writes if the batch is rejected."""
+    if not records:
+        return
+    page_size = page_size or int(os.getenv('PG_BATCH_SIZE', '500'))
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                f"INSERT INTO fair_metadata ({', '.join(FAIR_COLUMNS)}) VALUES %s {FAIR_UPSERT}",
+                [_fair_row(filename, fair_data) for filename, fair_data in records.items()],
+                page_size=page_size
+            )
+    except psycopg2.Error as e:
+        # One malformed value (e.g. an unparseable publication_date) rejects the whole statement.
+        print(f"[FAIR] bulk store failed ({e}); storing {len(records)} rows individually", flush=True)
+        for filename, fair_data in records.items():
+            try:
+                store_fair_metadata(filename, fair_data)
+            except psycopg2.Error as row_error:
+                print(f"[FAIR] store failed file={filename} error={row_error}", flush=True)
+
+def load_document_texts(filenames):
+    """Rebuild each document's text from its stored pdf_documents text chunks, in page order."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT filename, content
+            FROM pdf_documents
+            WHERE filename = ANY(%s) AND content_type = 'text'
+            ORDER BY filename, page_number, id
+        """, (list(filenames),))
+        texts = {}
+        for filename, content in cur.fetchall():
+            texts.setdefault(filename, []).append(content or "")
+    return {filename: "\n\n".join(parts) for filename, parts in texts.items()}
+
+def backfill_fair_metadata(filenames=None, batch_size=None):
+    """Extract and store FAIR metadata for ingested documents that have none (or for the given filenames).
+
+    The documents' Qdrant payloads are patched too, so the FAIR search filters see the backfilled fields.
+    """
+    # Imported lazily: process_pdf imports this module.
+    from process_pdf import apply_fair_metadata
+    from qdrant_setup import get_qdrant_client
+    if filenames is None:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT DISTINCT d.filename
+                FROM pdf_documents d
+                LEFT JOIN fair_metadata f ON f.filename = d.filename
+                WHERE f.filename IS NULL
+            """)
+            filenames = [row[0] for row in cur.fetchall()]
+    texts = load_document_texts(filenames)
+    papers = [{"filename": filename, "text": text} for filename, text in texts.items() if text]
+    results = extract_fair_metadata_batch(papers, batch_size=batch_size)
+    apply_fair_metadata(get_qdrant_client(), os.getenv('QDRANT_COLLECTION', 'pdf_documents'), results)
+    return results
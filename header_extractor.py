@@ -0,0 +1,127 @@
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Identifiers are only trusted in the opening of the paper; the reference list is full of other DOIs.
+HEADER_CHARS = int(os.getenv('FAIR_HEADER_CHARS', '5000'))
+
+DOI_RE = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>]+)", re.IGNORECASE)
+HANDLE_RE = re.compile(r"(?:hdl\.handle\.net/|\bhdl:\s*)(\d+(?:\.\d+)*/[^\s\"'<>]+)", re.IGNORECASE)
+ARK_RE = re.compile(r"\b(ark:/?\d{5,}/[^\s\"'<>]+)", re.IGNORECASE)
+ARXIV_RE = re.compile(r"\barXiv:\s*(\d{4}\.\d{4,5}(?:v\d+)?|[a-z\-]+(?:\.[A-Z]{2})?/\d{7}(?:v\d+)?)", re.IGNORECASE)
+ISSN_RE = re.compile(r"\b(?:e-?|p-?)?ISSN[:\s]*(\d{4}-\d{3}[\dXx])\b", re.IGNORECASE)
+PACS_BLOCK_RE = re.compile(r"PACS(?:\s+(?:numbers?|codes?))?\s*[:.]?\s*((?:\d{2}\.\d{2}\.[\w+\-]{2}[\s,;]*)+)", re.IGNORECASE)
+PACS_CODE_RE = re.compile(r"\d{2}\.\d{2}\.[\w+\-]{2}")
+CC_URL_RE = re.compile(r"creativecommons\.org/(licenses|publicdomain)/([a-z\-]+)/(\d\.\d)", re.IGNORECASE)
+CC_TEXT_RE = re.compile(r"\bCC[\s\-]?(BY(?:[\s\-](?:NC|SA|ND)){0,2}|0)(?:[\s\-](\d\.\d))?\b")
+CC_NAME_RE = re.compile(r"Creative Commons Attribution((?:[\s\-]+(?:NonCommercial|ShareAlike|NoDerivatives|NoDerivs))*)(?:[\s\-]+(\d\.\d))?", re.IGNORECASE)
+
+_CC_PARTS = {"noncommercial": "NC", "sharealike": "SA", "noderivatives": "ND", "noderivs": "ND"}
+# PDF info-dict fields are often template names or slide titles; they only hint, the LLM's value wins.
+HINT_FIELDS = ("title", "keywords")
+_JUNK_TITLES = re.compile(r"^(untitled|microsoft word|document\d*|\S+\.(docx?|tex|dvi|pdf))", re.IGNORECASE)
+
+def skip_llm_fields():
+    """Fields that, once found locally, make the FAIR LLM call unnecessary (FAIR_SKIP_LLM_FIELDS)."""
+    return [field.strip() for field in os.getenv('FAIR_SKIP_LLM_FIELDS', '').split(',') if field.strip()]
+
+def _info_value(value):
+    if isinstance(value, bytes):
+        for encoding in ("utf-8", "utf-16", "latin-1"):
+            try:
+                value = value.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+    value = str(value).strip().strip("\x00")
+    return value or None
+
+def _clean_identifier(value):
+    return value.rstrip(".,;:)]}")
+
+def _license(text):
+    match = CC_URL_RE.search(text)
+    if match:
+        if match.group(1).lower() == "publicdomain":
+            return f"CC0-{match.group(3)}"
+        return f"CC-{match.group(2).upper()}-{match.group(3)}"
+    match = CC_TEXT_RE.search(text)
+    if match:
+        if match.group(1) == "0":
+            return "CC0"
+        kind = re.sub(r"[\s\-]+", "-", match.group(1).upper())
+        return f"CC-{kind}-{match.group(2)}" if match.group(2) else f"CC-{kind}"
+    match = CC_NAME_RE.search(text)
+    if match:
+        parts = [_CC_PARTS[part.lower()] for part in re.split(r"[\s\-]+", match.group(1)) if part]
+        kind = "-".join(["BY", *parts])
+        return f"CC-{kind}-{match.group(2)}" if match.group(2) else f"CC-{kind}"
+    return None
+
+def extract_header_fields(pdf_text, pdf_info=None, header_chars=HEADER_CHARS):
+    """Pull identifiers, license, PACS codes and title from the first page and the PDF info dict.
+
+    Only fields that were actually found are returned, in the FAIR metadata field names.
+    """
+    header = (pdf_text or "")[:header_chars]
+    info = {str(key).lower(): _info_value(value) for key, value in (pdf_info or {}).items() if value}
+    found = {}
+
+    match = DOI_RE.search(header)
+    doi = info.get("doi") or (match.group(1) if match else None)
+    if doi:
+        found["doi"] = _clean_identifier(re.sub(r"^(https?://(dx\.)?doi\.org/|doi:\s*)", "", doi, flags=re.IGNORECASE))
+    match = HANDLE_RE.search(header)
+    if match:
+        found["handle"] = _clean_identifier(match.group(1))
+    match = ARK_RE.search(header)
+    if match:
+        found["ark"] = _clean_identifier(match.group(1))
+    match = ARXIV_RE.search(header)
+    if match:
+        found["arxiv_id"] = match.group(1)
+
+    issns = list(dict.fromkeys(match.upper() for match in ISSN_RE.findall(header)))
+    if issns:
+        found["issn"] = issns
+
+    license_name = _license(header) or (_license(info["rights"]) if info.get("rights") else None)
+    if license_name:
+        found["license"] = license_name
+
+    pacs_codes = []
+    for block in PACS_BLOCK_RE.findall(header):
+        pacs_codes.extend(PACS_CODE_RE.findall(block))
+    if pacs_codes:
+        found["pacs_codes"] = list(dict.fromkeys(pacs_codes))
+
+    title = info.get("title")
+    if title and len(title) > 10 and not _JUNK_TITLES.match(title):
+        found["title"] = " ".join(title.split())
+    keywords = info.get("keywords")
+    if keywords:
+        found["keywords"] = [keyword.strip() for keyword in re.split(r"[;,]", keywords) if keyword.strip()]
+
+    return found
+
+def split_hints(found):
+    """Split found fields into verbatim identifiers and info-dict hints."""
+    identifiers = {field: value for field, value in found.items() if field not in HINT_FIELDS}
+    hints = {field: value for field, value in found.items() if field in HINT_FIELDS}
+    return identifiers, hints
+
+def merge_extracted(extracted, found):
+    """Combine LLM output with found fields: identifiers override it, hints only fill what it left empty."""
+    identifiers, hints = split_hints(found)
+    merged = dict(extracted)
+    for field, value in hints.items():
+        if not merged.get(field):
+            merged[field] = value
+    merged.update(identifiers)
+    return merged
+
+def satisfies(found, fields):
+    """True when every configured field was found locally; an empty field list never satisfies."""
+    return bool(fields) and all(found.get(field) for field in fields)
@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+from db_setup import db_connection
+from process_pdf import process_pdf, purge_orphan_points
+from qdrant_setup import get_qdrant_client
+import json
+import os
+import threading
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '2'))
+# A job still 'running' at startup was interrupted if it started longer ago than this. The
+# default 0 suits one API process; raise it above the longest job when several share the database.
+STALE_JOB_SECONDS = int(os.getenv('INGEST_STALE_JOB_SECONDS', '0'))
+MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', '3'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _log(msg, **kwargs):
+    extra = " ".join(f"{k}={v}" for k, v in kwargs.items()) if kwargs else ""
+    print(f"[JOBS] {msg} {extra}".strip(), flush=True)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+    return _executor
+
+def _update_job(job_id, **fields):
+    assignments = ", ".join(f"{column} = %s" for column in fields)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"UPDATE ingest_jobs SET {assignments} WHERE id = %s", (*fields.values(), job_id))
+
+def create_job(filename, file_path, use_agent=False, options=None, job_id=None):
+    """Persist a queued job; returns the job id.
+
+    Job state lives only in ingest_jobs: pdf_metadata rows are written by process_pdf
+    once a document is stored, so queued or failed uploads never appear as documents.
+    """
+    job_id = job_id or str(uuid.uuid4())
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO ingest_jobs (id, filename, file_path, use_agent, options, status, stage)
+            VALUES (%s, %s, %s, %s, %s, 'queued', 'queued')
+        """, (job_id, filename, file_path, use_agent, json.dumps(options or {})))
+    return job_id
+
+def submit_job(job_id):
+    return _get_executor().submit(run_job, job_id)
+
+def enqueue(filename, file_path, use_agent=False, options=None, job_id=None):
+    job_id = create_job(filename, file_path, use_agent=use_agent, options=options, job_id=job_id)
+    submit_job(job_id)
+    _log("queued", job=job_id, file=filename, agent=use_agent)
+    return job_id
+
+def _claim_job(job_id):
+    """Move a queued job to running; returns None if another worker already took it."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE ingest_jobs
+            SET status = 'running', stage = 'starting', started_at = CURRENT_TIMESTAMP,
+                attempts = COALESCE(attempts, 0) + 1
+            WHERE id = %s AND status = 'queued'
+            RETURNING filename, file_path, use_agent, options
+        """, (job_id,))
+        row = cur.fetchone()
+    return row
+
+def _execute(job_id, file_path, use_agent, options):
+    def progress(stage):
+        _update_job(job_id, stage=stage)
+
+    if use_agent:
+        # Imported lazily: the agent workflow pulls in the LLM stack.
+        from agent_workflow import process_paper
+        result = process_paper(file_path, file_hash=options.get("file_hash"), file_size=options.get("file_size"))
+        return {
+            "message": "PDF processed with agent workflow",
+            "fair_metadata": result.get("fair_metadata", {})
+        }
+
+    result = process_pdf(file_path, progress=progress, **options)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    if result.get("deduplicated"):
+        result["message"] = f"Identical PDF already processed as {result['filename']}; returning stored result."
+    else:
+        result["message"] = f"PDF processed successfully. {result.get('points', 0)} items stored."
+    return result
+
+def run_job(job_id):
+    claimed = _claim_job(job_id)
+    if claimed is None:
+        return
+    filename, file_path, use_agent, options = claimed
+    _log("running", job=job_id, file=filename)
+    try:
+        result = _execute(job_id, file_path, use_agent, options or {})
+    except Exception as e:
+        _log("failed", job=job_id, file=filename, error=str(e))
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE ingest_jobs
+                SET status = 'failed', error = %s, finished_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (str(e), job_id))
+        return
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE ingest_jobs
+            SET status = 'completed', stage = 'done', result = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (json.dumps(result, default=str), job_id))
+    _log("completed", job=job_id, file=filename)
+
+def latest_job(filename):
+    """Most recent job for an uploaded filename, or None."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id FROM ingest_jobs WHERE filename = %s
+            ORDER BY created_at DESC LIMIT 1
+        """, (filename,))
+        row = cur.fetchone()
+    return get_job(str(row[0])) if row else None
+
+def get_job(job_id):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, filename, use_agent, status, stage, result, error,
+                   created_at, started_at, finished_at
+            FROM ingest_jobs WHERE id = %s
+        """, (job_id,))
+        row = cur.fetchone()
+    if not row:
+        return None
+    return {
+        "job_id": str(row[0]),
+        "filename": row[1],
+        "use_agent": row[2],
+        "status": row[3],
+        "stage": row[4],
+        "result": row[5],
+        "error": row[6],
+        "created_at": str(row[7]),
+        "started_at": str(row[8]) if row[8] else None,
+        "finished_at": str(row[9]) if row[9] else None
+    }
+
+def recover_stale_jobs():
+    """Requeue jobs left 'running' by a crashed or restarted process; fail those out of attempts."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE ingest_jobs
+            SET status = 'failed', error = 'Interrupted too many times', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND started_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+              AND COALESCE(attempts, 0) >= %s
+            RETURNING id
+        """, (STALE_JOB_SECONDS, MAX_ATTEMPTS))
+        failed = cur.fetchall()
+        cur.execute("""
+            UPDATE ingest_jobs
+            SET status = 'queued', stage = 'queued', started_at = NULL
+            WHERE status = 'running' AND started_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+            RETURNING id
+        """, (STALE_JOB_SECONDS,))
+        requeued = cur.fetchall()
+    if failed or requeued:
+        _log("recovered stale jobs", requeued=len(requeued), failed=len(failed))
+    return [str(row[0]) for row in requeued]
+
+def resume_queued_jobs():
+    """Resubmit jobs left queued or interrupted by a previous process (e.g. after a restart)."""
+    recover_stale_jobs()
+    try:
+        purge_orphan_points(get_qdrant_client(), os.getenv('QDRANT_COLLECTION', 'pdf_documents'))
+    except Exception as e:
+        _log("orphan purge failed", error=e)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM ingest_jobs WHERE status = 'queued' ORDER BY created_at")
+        job_ids = [str(row[0]) for row in cur.fetchall()]
+    for job_id in job_ids:
+        submit_job(job_id)
+    if job_ids:
+        _log("resumed", jobs=len(job_ids))
+    return job_ids
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False)
@@ -0,0 +1,123 @@
+from langchain_openai import ChatOpenAI
+from llm_cache import cache_enabled, get_llm_cache, prompt_key
+from llm_gateway import LLMGateway
+from langchain.schema import AIMessage
+from collections import namedtuple
+import asyncio
+import json
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+PROVIDER = os.getenv('LLM_PROVIDER', 'openai').lower()
+
+_PAPER_MARKER = re.compile(r"^=== PAPER: (.+?) ===$", re.MULTILINE)
+
+LLMResponse = namedtuple("LLMResponse", ["content", "cached"])
+
+def render_messages(messages):
+    """Normalise a prompt string or list of chat messages to [(role, content), ...]."""
+    if isinstance(messages, str):
+        return [("human", messages)]
+    return [(message.type, message.content) for message in messages]
+
+class MockChatModel:
+    """Offline stand-in for ChatOpenAI (LLM_PROVIDER=mock) returning deterministic, well-formed answers.
+
+    Batched FAIR prompts get a JSON object keyed by each "=== PAPER: <filename> ===" marker,
+    ReAct reasoning prompts get FINISH, anything else a single metadata object.
+    """
+
+    def __init__(self):
+        self.requests = 0
+
+    @staticmethod
+    def _metadata(text):
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        return {
+            "title": lines[0][:200] if lines else "",
+            "abstract": " ".join(lines[1:4])[:500],
+            "is_valid": True,
+            "completeness_score": 0.9,
+            "quality_score": 0.9,
+            "metadata_schema": "DataCite"
+        }
+
+    def invoke(self, messages):
+        self.requests += 1
+        prompt = render_messages(messages)[-1][1]
+        if "Action Input:" in prompt:
+            return AIMessage(content="Thought: mock model has nothing to add\nAction: FINISH\nAction Input:")
+        markers = list(_PAPER_MARKER.finditer(prompt))
+        if markers:
+            ends = [marker.start() for marker in markers[1:]] + [len(prompt)]
+            papers = {
+                marker.group(1): self._metadata(prompt[marker.end():end])
+                for marker, end in zip(markers, ends)
+            }
+            return AIMessage(content=json.dumps(papers))
+        return AIMessage(content=json.dumps(self._metadata(prompt)))
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+class CachedLLM:
+    """Single entry point for chat completions, backed by the persistent response cache."""
+
+    def __init__(self, model_name=MODEL_NAME):
+        if PROVIDER == "mock":
+            # Separate cache namespace so mock answers never mix with real completions.
+            self.model_name = "mock"
+            self.chat_model = MockChatModel()
+        else:
+            self.model_name = model_name
+            # Retries and timeouts are owned by the gateway.
+            self.chat_model = ChatOpenAI(
+                model=model_name,
+                temperature=0,
+                api_key=os.getenv('OPENAI_API_KEY'),
+                base_url=os.getenv('OPENAI_BASE_URL') or None,
+                max_retries=0
+            )
+        self.gateway = LLMGateway(self.chat_model)
+        self.calls = 0
+
+    def invoke(self, messages, bypass_cache=False):
+        use_cache = cache_enabled() and not bypass_cache
+        key = prompt_key(self.model_name, render_messages(messages)) if use_cache else None
+        if use_cache:
+            content = get_llm_cache().get(key)
+            if content is not None:
+                return LLMResponse(content, True)
+
+        self.calls += 1
+        content = self.gateway.invoke(messages).content
+        if use_cache:
+            get_llm_cache().put(key, self.model_name, content)
+        return LLMResponse(content, False)
+
+    async def ainvoke(self, messages, bypass_cache=False):
+        """Awaitable invoke for callers on their own event loop; the request still runs through the gateway."""
+        use_cache = cache_enabled() and not bypass_cache
+        key = prompt_key(self.model_name, render_messages(messages)) if use_cache else None
+        if use_cache:
+            content = get_llm_cache().get(key)
+            if content is not None:
+                return LLMResponse(content, True)
+
+        self.calls += 1
+        response = await asyncio.wrap_future(self.gateway.submit(messages))
+        if use_cache:
+            get_llm_cache().put(key, self.model_name, response.content)
+        return LLMResponse(response.content, False)
+
+    def stats(self):
+        stats = {"model": self.model_name, "llm_calls": self.calls, "gateway": self.gateway.stats()}
+        if cache_enabled():
+            stats["cache"] = get_llm_cache().stats()
+        return stats
+
+llm = CachedLLM()
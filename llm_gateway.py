@@ -0,0 +1,213 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+REQUESTS_PER_MINUTE = int(os.getenv('LLM_RPM', '500'))
+TOKENS_PER_MINUTE = int(os.getenv('LLM_TPM', '200000'))
+TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '60'))
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '5'))
+BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '1.0'))
+BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '30'))
+# Completion tokens charged against the TPM budget up front, before the response size is known.
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv('LLM_COMPLETION_TOKEN_ESTIMATE', '500'))
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+try:
+    import openai
+    RETRYABLE_ERRORS = (
+        asyncio.TimeoutError,
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    )
+except (ImportError, AttributeError):
+    RETRYABLE_ERRORS = (asyncio.TimeoutError, ConnectionError)
+
+def _log(msg, **kwargs):
+    extra = " ".join(f"{k}={v}" for k, v in kwargs.items()) if kwargs else ""
+    print(f"[LLM] {msg} {extra}".strip(), flush=True)
+
+def estimate_tokens(messages):
+    if isinstance(messages, str):
+        chars = len(messages)
+    else:
+        chars = sum(len(str(message.content)) for message in messages)
+    return chars // 4 + COMPLETION_TOKEN_ESTIMATE
+
+class TokenBucket:
+    """Refills per_minute units evenly over a minute; acquire() waits until enough are available."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                delay = (amount - self.tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_seconds": round(self.total / self.count, 4) if self.count else None,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): count for bound, count in zip(self.buckets, self.counts)}
+        }
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class LLMGateway:
+    """Rate-limited, retrying front for a chat model's ainvoke.
+
+    Calls run on one background event loop so that the concurrency cap and the
+    request/token buckets are shared by every thread in the process.
+    """
+
+    def __init__(self, chat_model, max_concurrency=MAX_CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE,
+                 tokens_per_minute=TOKENS_PER_MINUTE, timeout=TIMEOUT_SECONDS, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.chat_model = chat_model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.latency = LatencyHistogram()
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _get_loop(self):
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def _backoff(self, attempt, error):
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter keeps parallel callers that failed together from retrying together.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def ainvoke(self, messages):
+        """Must run on the gateway loop; use submit() or invoke() from other threads and loops."""
+        estimated_tokens = estimate_tokens(messages)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+                self.calls += 1
+                self.in_flight += 1
+                start = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(self.chat_model.ainvoke(messages), timeout=self.timeout)
+                    self.latency.observe(time.perf_counter() - start)
+                    return response
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.timeouts += 1
+                    if getattr(e, "status_code", None) == 429:
+                        self.rate_limited += 1
+                    if attempt == self.max_retries:
+                        self.failures += 1
+                        raise
+                    delay = self._backoff(attempt, e)
+                    self.retries += 1
+                    _log("retrying", attempt=attempt + 1, delay=f"{delay:.2f}s", error=type(e).__name__)
+                except Exception:
+                    self.failures += 1
+                    raise
+                finally:
+                    self.in_flight -= 1
+                await asyncio.sleep(delay)
+
+    def submit(self, messages):
+        """Schedule a call on the gateway loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self.ainvoke(messages), self._get_loop())
+
+    def invoke(self, messages):
+        return self.submit(messages).result()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self.requests.capacity,
+            "tokens_per_minute": self.tokens.capacity,
+            "rate_limit_wait_seconds": round(self.requests.waited + self.tokens.waited, 3),
+            "latency": self.latency.snapshot()
+        }
@@ -0,0 +1,243 @@
+import json
+import os
+import re
+from datetime import date
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# DataCite 4.4 mandatory properties and the FAIR record fields they are read from.
+REQUIRED_FIELDS = ["identifier", "creators", "titles", "publisher", "publicationYear", "resourceType"]
+RECOMMENDED_FIELDS = ["abstract", "keywords", "license", "publication_date", "repository_url", "subject_classifications", "language"]
+
+FAIR_FIELDS = {
+    "findable": ["doi", "title", "authors", "keywords", "abstract"],
+    "accessible": ["license", "repository_url", "data_availability"],
+    "interoperable": ["metadata_schema", "datacite_schema", "pacs_codes", "subject_classifications"],
+    "reusable": ["license", "methodology", "citation_info", "publication_date"]
+}
+
+DOI_RE = re.compile(r"^10\.\d{4,9}/[-._;()/:<>\[\]A-Za-z0-9]+$")
+DOI_PREFIX_RE = re.compile(r"^(https?://(dx\.)?doi\.org/|doi:\s*)", re.IGNORECASE)
+ORCID_RE = re.compile(r"^\d{4}-\d{4}-\d{4}-\d{3}[\dX]$")
+ORCID_PREFIX_RE = re.compile(r"^https?://orcid\.org/", re.IGNORECASE)
+ISSN_RE = re.compile(r"\b(\d{4})-?(\d{3}[\dXx])\b")
+HANDLE_RE = re.compile(r"^\d+(\.\d+)*/\S+$")
+ARK_RE = re.compile(r"^ark:/?\d{5,}/\S+$", re.IGNORECASE)
+DATE_RE = re.compile(r"^(\d{4})(-(\d{2})(-(\d{2}))?)?$")
+
+def semantic_validation_enabled():
+    return os.getenv('METADATA_SEMANTIC_VALIDATION', 'false').lower() in ('1', 'true', 'yes')
+
+def _present(value):
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return bool(value.strip()) and value.strip().lower() not in ("null", "none", "n/a", "unknown")
+    if isinstance(value, (list, dict)):
+        return bool(value)
+    return True
+
+def _schema(metadata):
+    schema = metadata.get("datacite_schema")
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            schema = {}
+    return schema if isinstance(schema, dict) else {}
+
+def normalize_doi(doi):
+    return DOI_PREFIX_RE.sub("", str(doi).strip())
+
+def is_valid_doi(doi):
+    return bool(DOI_RE.match(normalize_doi(doi)))
+
+def is_valid_orcid(orcid):
+    """ORCID iD format plus the ISO 7064 MOD 11-2 check character."""
+    orcid = ORCID_PREFIX_RE.sub("", str(orcid).strip()).upper()
+    if not ORCID_RE.match(orcid):
+        return False
+    digits = orcid.replace("-", "")
+    total = 0
+    for char in digits[:-1]:
+        total = (total + int(char)) * 2
+    check = (12 - total % 11) % 11
+    return digits[-1] == ("X" if check == 10 else str(check))
+
+def is_valid_issn(issn):
+    """ISSN format plus the weighted mod-11 check digit."""
+    match = ISSN_RE.fullmatch(str(issn).strip())
+    if not match:
+        return False
+    digits = match.group(1) + match.group(2).upper()
+    total = sum(int(char) * weight for char, weight in zip(digits[:7], range(8, 1, -1)))
+    check = (11 - total % 11) % 11
+    return digits[-1] == ("X" if check == 10 else str(check))
+
+def parse_iso_date(value):
+    """Return (year, month, day) for YYYY, YYYY-MM or YYYY-MM-DD; None if not a valid date."""
+    match = DATE_RE.match(str(value).strip())
+    if not match:
+        return None
+    year = int(match.group(1))
+    month = int(match.group(3)) if match.group(3) else 1
+    day = int(match.group(5)) if match.group(5) else 1
+    try:
+        date(year, month, day)
+    except ValueError:
+        return None
+    return year, month, day
+
+def _creators(metadata, schema):
+    creators = schema.get("creators") or metadata.get("authors") or []
+    if isinstance(creators, (str, dict)):
+        creators = [creators]
+    return creators
+
+def _publication_year(metadata, schema):
+    year = schema.get("publicationYear")
+    if _present(year):
+        return str(year).strip()
+    if _present(metadata.get("publication_date")):
+        parsed = parse_iso_date(metadata["publication_date"])
+        return str(parsed[0]) if parsed else None
+    return None
+
+def _issns(metadata, schema):
+    sources = [metadata.get("journal"), metadata.get("issn"), schema.get("issn")]
+    found = []
+    for source in sources:
+        if isinstance(source, dict):
+            source = source.get("issn") or source.get("ISSN")
+        if isinstance(source, list):
+            source = " ".join(str(item) for item in source)
+        if _present(source):
+            found.extend(m.group(0) for m in ISSN_RE.finditer(str(source)))
+    return list(dict.fromkeys(found))
+
+def _required_values(metadata, schema):
+    return {
+        "identifier": schema.get("identifier") or metadata.get("doi"),
+        "creators": _creators(metadata, schema),
+        "titles": schema.get("titles") or metadata.get("title"),
+        "publisher": schema.get("publisher") or metadata.get("journal"),
+        "publicationYear": _publication_year(metadata, schema),
+        "resourceType": schema.get("resourceType") or schema.get("resourceTypeGeneral") or metadata.get("resource_type")
+    }
+
+def _fair_scores(metadata):
+    return {
+        principle: round(sum(1 for field in fields if _present(metadata.get(field))) / len(fields), 2)
+        for principle, fields in FAIR_FIELDS.items()
+    }
+
+def validate_datacite(metadata):
+    """Deterministic DataCite 4.4 check of a FAIR metadata record.
+
+    Returns is_valid, missing_fields, errors, warnings, completeness_score and fair_scores,
+    the same shape the LLM validator produced.
+    """
+    metadata = metadata if isinstance(metadata, dict) else {}
+    schema = _schema(metadata)
+    errors = []
+    warnings = []
+
+    required = _required_values(metadata, schema)
+    missing_fields = [field for field in REQUIRED_FIELDS if not _present(required[field])]
+    if "identifier" in missing_fields and (_present(metadata.get("handle")) or _present(metadata.get("ark"))):
+        warnings.append("No DOI; a handle or ARK is present but DataCite registers DOIs")
+
+    doi = metadata.get("doi")
+    if _present(doi) and not is_valid_doi(doi):
+        errors.append(f"Invalid DOI syntax: {doi}")
+    handle = metadata.get("handle")
+    if _present(handle) and not HANDLE_RE.match(str(handle).strip()):
+        warnings.append(f"Unrecognised handle format: {handle}")
+    ark = metadata.get("ark")
+    if _present(ark) and not ARK_RE.match(str(ark).strip()):
+        warnings.append(f"Unrecognised ARK format: {ark}")
+
+    publication_date = metadata.get("publication_date")
+    if _present(publication_date) and parse_iso_date(publication_date) is None:
+        errors.append(f"publication_date is not an ISO 8601 date (YYYY-MM-DD): {publication_date}")
+    year = required["publicationYear"]
+    if _present(year):
+        if not re.fullmatch(r"\d{4}", year):
+            errors.append(f"publicationYear must be a four-digit year: {year}")
+        elif not 1600 <= int(year) <= date.today().year + 1:
+            warnings.append(f"Implausible publicationYear: {year}")
+
+    for index, creator in enumerate(required["creators"]):
+        if isinstance(creator, dict):
+            name = creator.get("name") or creator.get("creatorName")
+            if not _present(name):
+                errors.append(f"Creator {index + 1} has no name")
+            orcid = creator.get("orcid") or creator.get("nameIdentifier")
+            if _present(orcid) and not is_valid_orcid(orcid):
+                errors.append(f"Invalid ORCID for {name or f'creator {index + 1}'}: {orcid}")
+        elif not _present(creator):
+            errors.append(f"Creator {index + 1} has no name")
+
+    for issn in _issns(metadata, schema):
+        if not is_valid_issn(issn):
+            errors.append(f"ISSN check digit mismatch: {issn}")
+
+    repository_url = metadata.get("repository_url")
+    if _present(repository_url) and not str(repository_url).startswith(("http://", "https://")):
+        warnings.append(f"repository_url is not an http(s) URL: {repository_url}")
+    for field in ("license", "abstract", "keywords"):
+        if not _present(metadata.get(field)):
+            warnings.append(f"Recommended field missing: {field}")
+
+    recommended_present = sum(
+        1 for field in RECOMMENDED_FIELDS
+        if _present(metadata.get(field)) or _present(schema.get(field))
+    )
+    # Mandatory properties count double towards completeness.
+    completeness = (
+        2 * (len(REQUIRED_FIELDS) - len(missing_fields)) + recommended_present
+    ) / (2 * len(REQUIRED_FIELDS) + len(RECOMMENDED_FIELDS))
+
+    return {
+        "is_valid": not missing_fields and not errors,
+        "missing_fields": missing_fields,
+        "errors": errors,
+        "warnings": warnings,
+        "completeness_score": round(completeness, 2),
+        "fair_scores": _fair_scores(metadata)
+    }
+
+def semantic_review(metadata):
+    """LLM pass for what rules cannot check: consistency of title, abstract, keywords and classifications."""
+    # Imported lazily so the rule-based validator has no LLM dependency.
+    from langchain.prompts import ChatPromptTemplate
+    from llm_client import llm
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", """Formats and required fields have already been checked. Review only the semantics of this metadata:
+- Do title, abstract and keywords describe the same work?
+- Are PACS codes, MeSH terms and subject classifications plausible for it?
+- Are author names and affiliations coherent?
+Return JSON with errors (list) and warnings (list)."""),
+        ("human", "Review: {metadata}")
+    ])
+    response = llm.invoke(prompt.format_messages(metadata=json.dumps(metadata, indent=2, default=str)))
+    try:
+        review = json.loads(response.content)
+    except ValueError:
+        return {"errors": [], "warnings": ["Semantic review returned no parseable result"]}
+    return {"errors": list(review.get("errors") or []), "warnings": list(review.get("warnings") or [])}
+
+def validate(metadata, semantic=None):
+    """Rule-based validation, optionally followed by the LLM semantic review (METADATA_SEMANTIC_VALIDATION)."""
+    result = validate_datacite(metadata)
+    if semantic is None:
+        semantic = semantic_validation_enabled()
+    if semantic:
+        review = semantic_review(metadata)
+        result["errors"].extend(review["errors"])
+        result["warnings"].extend(review["warnings"])
+        result["is_valid"] = not result["missing_fields"] and not result["errors"]
+        result["semantic_checked"] = True
+    return result
@@ -2,57 +2,187 @@ import pdfplumber
 import fitz
 import json
 import os
+import hashlib
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '32'))
+
+def get_extract_workers():
+    return max(1, int(os.getenv('PDF_EXTRACT_WORKERS', '1')))
+
+@contextmanager
+def _open_document(pdf_path, plumber=True, mupdf=True):
+    """Open the PDF once per backend and close both handles on exit."""
+    pdf = pdfplumber.open(pdf_path) if plumber else None
+    doc = None
+    try:
+        doc = fitz.open(pdf_path) if mupdf else None
+        yield pdf, doc
+    finally:
+        if doc is not None:
+            doc.close()
+        if pdf is not None:
+            pdf.close()
+
+def _page_count(pdf, doc):
+    return len(pdf.pages) if pdf is not None else len(doc)
+
+def _extract_page_images(doc, page_index, output_dir):
+    images = []
+    for img_index, img in enumerate(doc[page_index].get_images()):
+        xref = img[0]
+        base_image = doc.extract_image(xref)
+        image_bytes = base_image["image"]
+        image_ext = base_image["ext"]
+
+        filename = f"page_{page_index+1}_img_{img_index+1}.{image_ext}"
+        image_path = os.path.join(output_dir, filename)
+
+        with open(image_path, "wb") as img_file:
+            img_file.write(image_bytes)
+
+        images.append({
+            'page': page_index + 1,
+            'path': image_path,
+            'sha256': hashlib.sha256(image_bytes).hexdigest()
+        })
+    return images
+
+def page_content_hash(record):
+    """SHA-256 over a page record's text, tables and image bytes; stable across re-extractions."""
+    digest = hashlib.sha256()
+    digest.update((record['text'] or '').encode('utf-8'))
+    digest.update(json.dumps(record['tables'], sort_keys=True).encode('utf-8'))
+    for image in record['images']:
+        digest.update(image.get('sha256', image['path']).encode('utf-8'))
+    return digest.hexdigest()
+
+def _page_record(pdf, doc, page_index, text, tables, images, output_dir):
+    record = {
+        'page': page_index + 1,
+        'text': None,
+        'tables': [],
+        'images': []
+    }
+
+    if pdf is not None:
+        page = pdf.pages[page_index]
+        record['width'] = float(page.width)
+        record['height'] = float(page.height)
+        if text:
+            record['text'] = page.extract_text()
+        if tables:
+            record['tables'] = page.extract_tables() or []
+        # pdfplumber caches parsed layout objects per page; drop them so
+        # memory stays flat on long documents.
+        page.flush_cache()
+    else:
+        rect = doc[page_index].rect
+        record['width'] = float(rect.width)
+        record['height'] = float(rect.height)
+
+    if images:
+        record['images'] = _extract_page_images(doc, page_index, output_dir)
+
+    record['hash'] = page_content_hash(record)
+    return record
+
+def iter_pages(pdf_path, text=True, tables=True, images=True, output_dir='images'):
+    """Yield one record per page (text, tables, image refs, page size) in a single traversal."""
+    if images:
+        os.makedirs(output_dir, exist_ok=True)
+
+    with _open_document(pdf_path, plumber=text or tables, mupdf=images) as (pdf, doc):
+        for page_index in range(_page_count(pdf, doc)):
+            yield _page_record(pdf, doc, page_index, text, tables, images, output_dir)
+
+def split_page_records(pages):
+    """Flatten page records into the legacy (texts, tables, images) lists."""
+    texts, tables, images = [], [], []
+    for record in pages:
+        if record['text']:
+            texts.append({'page': record['page'], 'text': record['text']})
+        for table in record['tables']:
+            tables.append({'page': record['page'], 'table': table})
+        images.extend(record['images'])
+    return texts, tables, images
+
+def _extract_page_range(pdf_path, start, stop, output_dir):
+    """Worker entry point: open the PDF in this process and extract pages [start, stop)."""
+    with _open_document(pdf_path) as (pdf, doc):
+        return [
+            _page_record(pdf, doc, page_index, True, True, True, output_dir)
+            for page_index in range(start, stop)
+        ]
+
+def _page_ranges(total_pages, workers):
+    # Two shards per worker keeps the pool busy when page cost is uneven
+    # without paying for too many extra opens of the file.
+    shard_size = max(1, math.ceil(total_pages / (workers * 2)))
+    return [(start, min(start + shard_size, total_pages)) for start in range(0, total_pages, shard_size)]
+
+def _extract_pages_parallel(pdf_path, total_pages, output_dir, workers):
+    ranges = _page_ranges(total_pages, workers)
+    # spawn rather than fork: callers (uvicorn, Airflow) may hold threads and
+    # open handles that must not be duplicated into the workers.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+        shards = pool.map(
+            _extract_page_range,
+            [pdf_path] * len(ranges),
+            [start for start, _ in ranges],
+            [stop for _, stop in ranges],
+            [output_dir] * len(ranges)
+        )
+        return [record for shard in shards for record in shard]
+
+def extract_document(pdf_path, output_dir='images', workers=None):
+    """Extract text, tables, images and document metadata with one open of the PDF.
+
+    With workers > 1 (default: PDF_EXTRACT_WORKERS) documents of at least
+    PDF_PARALLEL_MIN_PAGES pages are sharded by page range across a process
+    pool; results are returned in page order either way.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = get_extract_workers() if workers is None else max(1, workers)
+
+    with _open_document(pdf_path) as (pdf, doc):
+        total_pages = len(pdf.pages)
+        metadata = pdf.metadata or {}
+        parallel = workers > 1 and total_pages >= PARALLEL_MIN_PAGES
+        if not parallel:
+            pages = [
+                _page_record(pdf, doc, page_index, True, True, True, output_dir)
+                for page_index in range(total_pages)
+            ]
+
+    if parallel:
+        pages = _extract_pages_parallel(pdf_path, total_pages, output_dir, workers)
+
+    texts, tables, images = split_page_records(pages)
+    return {
+        'total_pages': total_pages,
+        'metadata': metadata,
+        'pages': pages,
+        'texts': texts,
+        'tables': tables,
+        'images': images
+    }
 
 def extract_text(pdf_path):
-    text_content = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, 1):
-            text = page.extract_text()
-            if text:
-                text_content.append({
-                    'page': page_num,
-                    'text': text
-                })
-    return text_content
+    texts, _, _ = split_page_records(iter_pages(pdf_path, tables=False, images=False))
+    return texts
 
 def extract_tables(pdf_path):
-    tables_data = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, 1):
-            tables = page.extract_tables()
-            if tables:
-                for table in tables:
-                    tables_data.append({
-                        'page': page_num,
-                        'table': table
-                    })
-    return tables_data
+    _, tables, _ = split_page_records(iter_pages(pdf_path, text=False, images=False))
+    return tables
 
 def extract_images(pdf_path, output_dir='images'):
     os.makedirs(output_dir, exist_ok=True)
-    images = []
-    doc = fitz.open(pdf_path)
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        image_list = page.get_images()
-        
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
-            
-            filename = f"page_{page_num+1}_img_{img_index+1}.{image_ext}"
-            image_path = os.path.join(output_dir, filename)
-            
-            with open(image_path, "wb") as img_file:
-                img_file.write(image_bytes)
-            
-            images.append({
-                'page': page_num + 1,
-                'path': image_path
-            })
-    
-    doc.close()
+    _, _, images = split_page_records(
+        iter_pages(pdf_path, text=False, tables=False, output_dir=output_dir)
+    )
     return images
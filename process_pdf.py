@@ -2,20 +2,37 @@ import os
 import json
 import uuid
 import hashlib
+import time
 import pdfplumber
-from pdf_extractor import extract_text, extract_tables, extract_images
-from fair_extractor import extract_fair_metadata, store_fair_metadata
-from db_setup import get_connection
+from pdf_extractor import extract_document, split_page_records
+from fair_extractor import extract_fair_metadata, store_fair_metadata, store_fair_metadata_bulk
+from db_setup import db_connection, bulk_insert_documents
+from psycopg2.extras import execute_values
 from qdrant_setup import get_qdrant_client
-from sentence_transformers import SentenceTransformer
+from embedding_service import embed_texts
+from qdrant_writer import QdrantWriter
+from qdrant_client.models import PointIdsList, Filter, FieldCondition, MatchValue
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Post-commit Qdrant cleanup is retried this many times before the points are recorded as orphans.
+CLEANUP_RETRIES = int(os.getenv('QDRANT_CLEANUP_RETRIES', '2'))
+
+def _log(msg, **kwargs):
+    extra = " ".join(f"{k}={v}" for k, v in kwargs.items()) if kwargs else ""
+    print(f"[PDF] {msg} {extra}".strip(), flush=True)
+
+# Images are named page_N_img_M, so each document version gets its own directory, keyed by file hash.
+IMAGE_ROOT = 'images'
+
+def image_dir(file_hash):
+    return os.path.join(IMAGE_ROOT, file_hash)
+
 def get_file_hash(file_path):
     hash_sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
             hash_sha256.update(chunk)
     return hash_sha256.hexdigest()
 
@@ -29,37 +46,84 @@ def get_pdf_metadata(pdf_path):
     except:
         return {"total_pages": 0, "metadata": {}}
 
-def process_pdf(pdf_path, skip_fair=False, fair_metadata=None):
-    if not os.path.exists(pdf_path):
-        return {"error": f"PDF not found: {pdf_path}"}
-    
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    conn = get_connection()
-    cur = conn.cursor()
-    qdrant = get_qdrant_client()
-    collection_name = os.getenv('QDRANT_COLLECTION', 'pdf_documents')
-    
-    filename = os.path.basename(pdf_path)
-    file_size = os.path.getsize(pdf_path)
-    file_hash = get_file_hash(pdf_path)
-    pdf_info = get_pdf_metadata(pdf_path)
-    
-    texts = extract_text(pdf_path)
-    tables = extract_tables(pdf_path)
-    images = extract_images(pdf_path)
-    
-    total_chunks = len(texts) + len(tables) + len(images)
-    
-    fair_data = fair_metadata or {}
-    if not skip_fair:
-        full_text = "\n\n".join([item['text'] for item in texts])
-        if full_text:
-            fair_data = extract_fair_metadata(full_text)
-            store_fair_metadata(filename, fair_data)
+def find_ingested_document(cur, file_hash, filename=None):
+    """Return the stored result for a completed ingest of this hash, preferring a row under the same filename."""
+    cur.execute("""
+        SELECT filename, file_size, total_pages
+        FROM pdf_metadata
+        WHERE file_hash = %s AND processing_status = 'completed'
+        ORDER BY (filename = %s) DESC, upload_timestamp DESC
+        LIMIT 1
+    """, (file_hash, filename))
+    row = cur.fetchone()
+    if not row:
+        return None
     
-    points = []
+    cur.execute("""
+        SELECT content_type, COUNT(*)
+        FROM pdf_documents
+        WHERE filename = %s
+        GROUP BY content_type
+    """, (row[0],))
+    chunk_stats = {r[0]: r[1] for r in cur.fetchall()}
+    total_chunks = sum(chunk_stats.values())
     
-    base_payload = {
+    return {
+        "status": "success",
+        "filename": row[0],
+        "points": total_chunks,
+        "deduplicated": True,
+        "metadata": {
+            "file_size": row[1],
+            "total_pages": row[2],
+            "file_hash": file_hash,
+            "text_chunks": chunk_stats.get('text', 0),
+            "table_chunks": chunk_stats.get('table', 0),
+            "image_chunks": chunk_stats.get('image', 0),
+            "total_chunks": total_chunks
+        }
+    }
+
+def load_page_index(cur, filename):
+    """Map page_number -> stored page_hash and qdrant ids for the rows already ingested under filename."""
+    cur.execute("""
+        SELECT page_number, page_hash, qdrant_id
+        FROM pdf_documents WHERE filename = %s
+    """, (filename,))
+    pages = {}
+    for page_number, page_hash, qdrant_id in cur.fetchall():
+        entry = pages.setdefault(page_number, {"hash": page_hash, "qdrant_ids": []})
+        if entry["hash"] != page_hash:
+            entry["hash"] = None
+        if qdrant_id:
+            entry["qdrant_ids"].append(qdrant_id)
+    return pages
+
+def diff_pages(pages, stored_pages):
+    """Return (page records that are new or changed, stored page numbers that are changed or removed)."""
+    current = {record['page']: record['hash'] for record in pages}
+    changed = [
+        record for record in pages
+        if (record['text'] or record['tables'] or record['images'])
+        and (record['page'] not in stored_pages or stored_pages[record['page']]["hash"] != record['hash'])
+    ]
+    stale = [
+        page_number for page_number, entry in stored_pages.items()
+        if current.get(page_number) != entry["hash"]
+    ]
+    return changed, stale
+
+def delete_pages(cur, filename, stored_pages, page_numbers):
+    """Delete the rows of these pages; returns their Qdrant ids, to be removed once the delete is committed."""
+    if not page_numbers:
+        return []
+    cur.execute("""
+        DELETE FROM pdf_documents WHERE filename = %s AND page_number = ANY(%s)
+    """, (filename, list(page_numbers)))
+    return [point_id for page in page_numbers for point_id in stored_pages[page]["qdrant_ids"]]
+
+def fair_payload(filename, fair_data):
+    return {
         "filename": filename,
         "doi": fair_data.get('doi'),
         "title": fair_data.get('title'),
@@ -68,73 +132,115 @@ def process_pdf(pdf_path, skip_fair=False, fair_metadata=None):
         "publication_date": fair_data.get('publication_date'),
         "keywords": fair_data.get('keywords', [])
     }
-    
+
+def update_document_payload(qdrant, collection_name, filename, fair_data):
+    """Patch the FAIR fields onto every Qdrant point of a document."""
+    qdrant.set_payload(
+        collection_name=collection_name,
+        payload=fair_payload(filename, fair_data),
+        points=Filter(must=[FieldCondition(key="filename", match=MatchValue(value=filename))])
+    )
+
+def apply_fair_metadata(qdrant, collection_name, results):
+    """Store {filename: fair_data} rows and patch each document's Qdrant payload to match."""
+    store_fair_metadata_bulk(results)
+    for filename, fair_data in results.items():
+        update_document_payload(qdrant, collection_name, filename, fair_data)
+
+def build_chunks(texts, tables, images):
+    """One chunk per text page, table and image: the string to embed plus its pdf_documents columns."""
+    chunks = []
     for item in texts:
-        embedding = model.encode(item['text']).tolist()
-        point_id = str(uuid.uuid4())
-        
-        cur.execute("""
-            INSERT INTO pdf_documents (filename, page_number, content_type, content, qdrant_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (filename, item['page'], 'text', item['text'], point_id))
-        
-        points.append({
-            "id": point_id,
-            "vector": embedding,
-            "payload": {
-                **base_payload,
-                "page": item['page'],
-                "content_type": "text",
-                "content": item['text']
-            }
+        chunks.append({
+            "page": item['page'],
+            "content_type": "text",
+            "embed_text": item['text'],
+            "content": item['text'],
+            "table_data": None,
+            "image_path": None
         })
-    
     for item in tables:
-        embedding = model.encode(str(item['table'])).tolist()
-        point_id = str(uuid.uuid4())
-        
-        cur.execute("""
-            INSERT INTO pdf_documents (filename, page_number, content_type, table_data, qdrant_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (filename, item['page'], 'table', json.dumps(item['table']), point_id))
-        
-        points.append({
-            "id": point_id,
-            "vector": embedding,
-            "payload": {
-                **base_payload,
-                "page": item['page'],
-                "content_type": "table",
-                "table_data": item['table']
-            }
+        chunks.append({
+            "page": item['page'],
+            "content_type": "table",
+            "embed_text": str(item['table']),
+            "content": None,
+            "table_data": item['table'],
+            "image_path": None
         })
-    
     for item in images:
-        embedding = model.encode(f"Image from page {item['page']}").tolist()
-        point_id = str(uuid.uuid4())
-        
-        cur.execute("""
-            INSERT INTO pdf_documents (filename, page_number, content_type, image_path, qdrant_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (filename, item['page'], 'image', item['path'], point_id))
-        
-        points.append({
-            "id": point_id,
-            "vector": embedding,
-            "payload": {
-                **base_payload,
-                "page": item['page'],
-                "content_type": "image",
-                "image_path": item['path']
-            }
+        chunks.append({
+            "page": item['page'],
+            "content_type": "image",
+            "embed_text": f"Image from page {item['page']}",
+            "content": None,
+            "table_data": None,
+            "image_path": item['path']
         })
+    return chunks
+
+def document_row(filename, chunk, point_id, page_hash):
+    """pdf_documents row for a chunk, in db_setup.DOCUMENT_COLUMNS order."""
+    table_data = json.dumps(chunk['table_data']) if chunk['table_data'] is not None else None
+    return (filename, chunk['page'], chunk['content_type'], chunk['content'],
+            chunk['image_path'], table_data, point_id, page_hash)
+
+def chunk_payload(chunk, base_payload):
+    payload = {
+        **base_payload,
+        "page": chunk['page'],
+        "content_type": chunk['content_type']
+    }
+    if chunk['content_type'] == "text":
+        payload["content"] = chunk['content']
+    elif chunk['content_type'] == "table":
+        payload["table_data"] = chunk['table_data']
+    else:
+        payload["image_path"] = chunk['image_path']
+    return payload
+
+def stage_document(filename, document, stored_pages, fair_data=None, force=False):
+    """Diff an extracted document against its stored page index and build the chunks to embed and write."""
+    fair_data = fair_data or {}
+    if force:
+        changed_pages, stale_pages = document['pages'], list(stored_pages)
+    else:
+        changed_pages, stale_pages = diff_pages(document['pages'], stored_pages)
+    return {
+        "filename": filename,
+        "document": document,
+        "fair_data": fair_data,
+        "base_payload": fair_payload(filename, fair_data),
+        "stored_pages": stored_pages,
+        "changed_pages": changed_pages,
+        "stale_pages": stale_pages,
+        "unchanged_pages": len(stored_pages) - len(stale_pages),
+        "page_hashes": {record['page']: record['hash'] for record in changed_pages},
+        "chunks": build_chunks(*split_page_records(changed_pages))
+    }
+
+def write_staged(cur, writer, items, point_ids):
+    """Write [(staged, vectors, file_hash, file_size)] with one bulk INSERT; points go through the QdrantWriter.
+
+    New point ids are appended to point_ids as they are buffered, so the caller can remove them
+    if the transaction fails. Returns the Qdrant ids of replaced pages.
+    """
+    rows = []
+    stale_ids = []
+    for staged, doc_vectors, _, _ in items:
+        stale_ids.extend(delete_pages(cur, staged['filename'], staged['stored_pages'], staged['stale_pages']))
+        for chunk, vector in zip(staged['chunks'], doc_vectors):
+            point_id = str(uuid.uuid4())
+            point_ids.append(point_id)
+            rows.append(document_row(staged['filename'], chunk, point_id, staged['page_hashes'][chunk['page']]))
+            writer.add(point_id, vector, chunk_payload(chunk, staged['base_payload']))
     
-    if points:
-        qdrant.upsert(collection_name=collection_name, points=points)
+    bulk_insert_documents(cur, rows)
+    writer.flush()
     
-    cur.execute("""
+    execute_values(cur, """
         INSERT INTO pdf_metadata (filename, file_size, total_pages, file_hash, processing_status, metadata)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        VALUES %s
         ON CONFLICT (filename) 
         DO UPDATE SET 
             file_size = EXCLUDED.file_size,
@@ -143,22 +249,158 @@ def process_pdf(pdf_path, skip_fair=False, fair_metadata=None):
             processing_status = EXCLUDED.processing_status,
             metadata = EXCLUDED.metadata,
             upload_timestamp = CURRENT_TIMESTAMP
-    """, (filename, file_size, pdf_info['total_pages'], file_hash, 'completed', json.dumps(pdf_info['metadata'])))
-    
-    conn.commit()
-    conn.close()
+    """, [
+        (staged['filename'], file_size, staged['document']['total_pages'], file_hash, 'completed',
+         json.dumps(staged['document']['metadata']))
+        for staged, _, file_hash, file_size in items
+    ])
+    return stale_ids
+
+def write_documents(writer, items):
+    """Store staged documents in one transaction and keep Qdrant consistent with its outcome.
+
+    If anything fails before the commit completes, the new points are deleted again; replaced
+    pages lose their old points and documents get their FAIR payload only after the commit.
+    Those steps are retried but never raise; stale points that still cannot be deleted are
+    recorded in qdrant_orphans for purge_orphan_points().
+    """
+    qdrant, collection_name = writer.client, writer.collection_name
+    point_ids = []
+    try:
+        with db_connection() as conn:
+            stale_ids = write_staged(conn.cursor(), writer, items, point_ids)
+    except Exception:
+        writer.discard()
+        if point_ids:
+            qdrant.delete(collection_name=collection_name, points_selector=PointIdsList(points=point_ids))
+        raise
     
+    # The data is committed from here on, so cleanup failures are logged rather than raised.
+    if stale_ids:
+        try:
+            _with_retries(lambda: qdrant.delete(collection_name=collection_name, points_selector=PointIdsList(points=stale_ids)))
+        except Exception as e:
+            _log("stale point delete failed; recording orphans", points=len(stale_ids), error=e)
+            record_orphan_points(stale_ids, ", ".join(staged['filename'] for staged, _, _, _ in items))
+    for staged, _, _, _ in items:
+        if staged['fair_data'] and staged['unchanged_pages']:
+            try:
+                _with_retries(lambda: update_document_payload(qdrant, collection_name, staged['filename'], staged['fair_data']))
+            except Exception as e:
+                _log("payload patch failed", file=staged['filename'], error=e)
+
+def _with_retries(call, retries=None):
+    retries = CLEANUP_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+def record_orphan_points(point_ids, filename=None):
+    """Remember Qdrant points whose delete failed so purge_orphan_points() can remove them later."""
+    try:
+        with db_connection() as conn:
+            execute_values(conn.cursor(), """
+                INSERT INTO qdrant_orphans (qdrant_id, filename) VALUES %s
+                ON CONFLICT (qdrant_id) DO NOTHING
+            """, [(point_id, filename) for point_id in point_ids])
+    except Exception as e:
+        _log("could not record orphan points", points=len(point_ids), ids=",".join(point_ids), error=e)
+
+def purge_orphan_points(qdrant, collection_name, limit=1000):
+    """Delete recorded orphan points from Qdrant; returns how many were purged."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT qdrant_id FROM qdrant_orphans ORDER BY created_at LIMIT %s", (limit,))
+        point_ids = [row[0] for row in cur.fetchall()]
+        if point_ids:
+            qdrant.delete(collection_name=collection_name, points_selector=PointIdsList(points=point_ids))
+            cur.execute("DELETE FROM qdrant_orphans WHERE qdrant_id = ANY(%s)", (point_ids,))
+    if point_ids:
+        _log("purged orphan points", points=len(point_ids))
+    return len(point_ids)
+
+def staged_result(staged, file_hash, file_size):
+    document = staged['document']
     return {
         "status": "success", 
-        "filename": filename, 
-        "points": len(points),
+        "filename": staged['filename'], 
+        "points": len(staged['chunks']),
         "metadata": {
             "file_size": file_size,
-            "total_pages": pdf_info['total_pages'],
+            "total_pages": document['total_pages'],
             "file_hash": file_hash,
-            "text_chunks": len(texts),
-            "table_chunks": len(tables),
-            "image_chunks": len(images),
-            "total_chunks": total_chunks
+            "text_chunks": len(document['texts']),
+            "table_chunks": len(document['tables']),
+            "image_chunks": len(document['images']),
+            "total_chunks": len(document['texts']) + len(document['tables']) + len(document['images']),
+            "pages_changed": len(staged['changed_pages']),
+            "pages_unchanged": staged['unchanged_pages'],
+            "pages_removed": len(set(staged['stale_pages']) - set(staged['page_hashes']))
         }
     }
+
+def process_pdf(pdf_path, skip_fair=False, fair_metadata=None, workers=None, force=False, progress=None,
+                file_hash=None, file_size=None, extracted=None):
+    """Extract, embed and store a PDF.
+
+    extracted takes the output of pdf_extractor.extract_document for this file
+    when the caller has already parsed it, so the PDF is not opened again.
+    """
+    if not os.path.exists(pdf_path):
+        return {"error": f"PDF not found: {pdf_path}"}
+    
+    def report(stage):
+        if progress:
+            progress(stage)
+    
+    qdrant = get_qdrant_client()
+    collection_name = os.getenv('QDRANT_COLLECTION', 'pdf_documents')
+    
+    filename = os.path.basename(pdf_path)
+    # Callers that streamed the file (the upload endpoint) already know its hash and size.
+    if file_size is None:
+        file_size = os.path.getsize(pdf_path)
+    if file_hash is None:
+        file_hash = get_file_hash(pdf_path)
+    
+    existing = None
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if not force:
+            existing = find_ingested_document(cur, file_hash, filename)
+        if not existing:
+            stored_pages = load_page_index(cur, filename)
+    if existing:
+        # The content is already stored, but metadata supplied with this call is still new.
+        if fair_metadata:
+            store_fair_metadata(existing['filename'], fair_metadata)
+            update_document_payload(qdrant, collection_name, existing['filename'], fair_metadata)
+        return existing
+    
+    if extracted is not None:
+        document = extracted
+    else:
+        report("extracting")
+        document = extract_document(pdf_path, output_dir=image_dir(file_hash), workers=workers)
+    
+    fair_data = fair_metadata or {}
+    if not skip_fair:
+        full_text = "\n\n".join([item['text'] for item in document['texts']])
+        if full_text:
+            report("extracting_metadata")
+            fair_data = extract_fair_metadata(full_text, pdf_info=document['metadata'])
+            store_fair_metadata(filename, fair_data)
+    
+    staged = stage_document(filename, document, stored_pages, fair_data, force=force)
+    report("embedding")
+    vectors = embed_texts([chunk['embed_text'] for chunk in staged['chunks']])
+    
+    report("writing")
+    with QdrantWriter(qdrant, collection_name) as writer:
+        write_documents(writer, [(staged, vectors, file_hash, file_size)])
+    
+    return staged_result(staged, file_hash, file_size)
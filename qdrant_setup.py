@@ -2,16 +2,41 @@ from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams
 from qdrant_client.http.exceptions import UnexpectedResponse
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_qdrant_client():
+PREFER_GRPC = os.getenv('QDRANT_PREFER_GRPC', 'false').lower() in ('1', 'true', 'yes')
+GRPC_PORT = int(os.getenv('QDRANT_GRPC_PORT', '6334'))
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+def new_qdrant_client(prefer_grpc=None):
+    """Open a dedicated client; prefer get_qdrant_client() outside benchmarks."""
     return QdrantClient(
         url=os.getenv('QDRANT_URL', 'http://localhost:6333'),
-        api_key=os.getenv('QDRANT_API_KEY', None)
+        api_key=os.getenv('QDRANT_API_KEY', None),
+        prefer_grpc=PREFER_GRPC if prefer_grpc is None else prefer_grpc,
+        grpc_port=GRPC_PORT
     )
 
+def get_qdrant_client(prefer_grpc=None):
+    """Return this process's shared client (gRPC when QDRANT_PREFER_GRPC is set), recreating it after a fork."""
+    global _clients_pid
+    prefer_grpc = PREFER_GRPC if prefer_grpc is None else prefer_grpc
+    # gRPC channels do not survive a fork, so clients are never shared with child processes.
+    if _clients_pid != os.getpid() or prefer_grpc not in _clients:
+        with _clients_lock:
+            if _clients_pid != os.getpid():
+                _clients.clear()
+                _clients_pid = os.getpid()
+            if prefer_grpc not in _clients:
+                _clients[prefer_grpc] = new_qdrant_client(prefer_grpc)
+    return _clients[prefer_grpc]
+
 def setup_qdrant():
     client = get_qdrant_client()
     
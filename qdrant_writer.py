@@ -0,0 +1,155 @@
+import numpy as np
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from qdrant_client.models import Batch
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_SIZE = int(os.getenv('QDRANT_UPSERT_BATCH_SIZE', '256'))
+WORKERS = int(os.getenv('QDRANT_UPSERT_WORKERS', '4'))
+# Batches submitted but not yet acknowledged; add() blocks beyond this, which bounds memory.
+MAX_PENDING = int(os.getenv('QDRANT_UPSERT_MAX_PENDING', '8'))
+RETRIES = int(os.getenv('QDRANT_UPSERT_RETRIES', '2'))
+WAIT = os.getenv('QDRANT_UPSERT_WAIT', 'false').lower() in ('1', 'true', 'yes')
+
+def _log(msg, **kwargs):
+    extra = " ".join(f"{k}={v}" for k, v in kwargs.items()) if kwargs else ""
+    print(f"[QDRANT] {msg} {extra}".strip(), flush=True)
+
+class QdrantWriteError(Exception):
+    def __init__(self, failed):
+        self.failed = failed
+        points = sum(len(batch["ids"]) for batch in failed)
+        super().__init__(f"{len(failed)} Qdrant batches ({points} points) failed: {failed[-1]['error']}")
+
+class QdrantWriter:
+    """Buffers points across documents and upserts them in fixed-size batches on worker threads.
+
+    With wait=False Qdrant acknowledges a batch once it is in its write-ahead log, so
+    flush() returning means every point is accepted, not yet necessarily indexed.
+    Batches that still fail after retries are kept in `failed` for retry_failed().
+    """
+
+    def __init__(self, client, collection_name, batch_size=None, workers=None, max_pending=None,
+                 retries=None, wait_for_index=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size or BATCH_SIZE
+        self.workers = workers or WORKERS
+        self.max_pending = max_pending or MAX_PENDING
+        self.retries = RETRIES if retries is None else retries
+        self.wait = WAIT if wait_for_index is None else wait_for_index
+        self.failed = []
+        self._ids = []
+        self._vectors = []
+        self._payloads = []
+        self._pending = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._metrics = {"batches": 0, "points": 0, "retries": 0, "failures": 0, "flush_seconds": 0.0, "max_flush_seconds": 0.0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="qdrant-upsert")
+        return self._executor
+
+    def add(self, point_id, vector, payload):
+        """Buffer one point; vector may be a numpy row and is only converted when its batch is sent."""
+        self._ids.append(point_id)
+        self._vectors.append(vector)
+        self._payloads.append(payload)
+        if len(self._ids) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        if not self._ids:
+            return
+        batch = {"ids": self._ids, "vectors": self._vectors, "payloads": self._payloads}
+        self._ids, self._vectors, self._payloads = [], [], []
+        while len(self._pending) >= self.max_pending:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+        self._pending.add(self._get_executor().submit(self._upsert, batch))
+
+    def _upsert(self, batch):
+        # One stack and one conversion per batch rather than a tolist() per vector.
+        vectors = np.asarray(batch["vectors"], dtype=np.float32).tolist()
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=Batch(ids=batch["ids"], vectors=vectors, payloads=batch["payloads"]),
+                    wait=self.wait
+                )
+            except Exception as e:
+                if attempt < self.retries:
+                    with self._lock:
+                        self._metrics["retries"] += 1
+                    time.sleep(0.5 * 2 ** attempt)
+                    continue
+                _log("batch failed", points=len(batch["ids"]), error=e)
+                with self._lock:
+                    self._metrics["failures"] += 1
+                    self.failed.append({**batch, "error": str(e)})
+                return
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._metrics["batches"] += 1
+                self._metrics["points"] += len(batch["ids"])
+                self._metrics["flush_seconds"] += elapsed
+                self._metrics["max_flush_seconds"] = max(self._metrics["max_flush_seconds"], elapsed)
+            return
+
+    def flush(self, raise_on_failure=True):
+        """Send the partial batch, wait for every pending batch and raise QdrantWriteError if any failed."""
+        self._submit()
+        wait(self._pending)
+        self._pending = set()
+        if raise_on_failure and self.failed:
+            raise QdrantWriteError(list(self.failed))
+        return self.stats()
+
+    def retry_failed(self):
+        """Resubmit failed batches; returns the number that failed again."""
+        with self._lock:
+            failed, self.failed = self.failed, []
+        for batch in failed:
+            self._pending.add(self._get_executor().submit(self._upsert, batch))
+        self.flush(raise_on_failure=False)
+        return len(self.failed)
+
+    def discard(self):
+        """Drop buffered points and failed batches, waiting for batches already sent."""
+        self._ids, self._vectors, self._payloads = [], [], []
+        wait(self._pending)
+        self._pending = set()
+        with self._lock:
+            self.failed = []
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        batches = metrics["batches"]
+        return {
+            **metrics,
+            "flush_seconds": round(metrics["flush_seconds"], 3),
+            "max_flush_seconds": round(metrics["max_flush_seconds"], 3),
+            "mean_flush_seconds": round(metrics["flush_seconds"] / batches, 4) if batches else None,
+            "failed_batches": len(self.failed),
+            "pending_batches": len(self._pending),
+            "buffered_points": len(self._ids)
+        }
@@ -1,9 +1,14 @@
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
+from llm_client import llm
 from langchain.tools import Tool
 from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from header_extractor import extract_header_fields
+import metadata_validator
 import json
 import os
+import re
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,96 +28,367 @@ def _tool_result_summary(tool_name: str, result: Any):
     else:
         print(f"[AGENT:tool] {tool_name} -> {str(result)[:100]}", flush=True)
 
-llm = ChatOpenAI(
-    model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-    temperature=0,
-    api_key=os.getenv('OPENAI_API_KEY')
+PROMPT_TOKEN_BUDGET = int(os.getenv('AGENT_PROMPT_TOKEN_BUDGET', '6000'))
+SCRATCHPAD_KEEP_RECENT = int(os.getenv('AGENT_SCRATCHPAD_KEEP_RECENT', '2'))
+OBSERVATION_CHAR_LIMIT = int(os.getenv('AGENT_OBSERVATION_CHAR_LIMIT', '3000'))
+ACTION_INPUT_CHAR_LIMIT = 500
+MIN_OBSERVATION_CHARS = 200
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+def _compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + f"...[+{len(text) - limit} chars]"
+
+def _metadata_diff(old: Dict, new: Dict) -> Dict:
+    diff = {
+        "added": {k: v for k, v in new.items() if k not in old},
+        "changed": {k: v for k, v in new.items() if k in old and old[k] != v},
+        "removed": [k for k in old if k not in new]
+    }
+    return {k: v for k, v in diff.items() if v}
+
+class AgentScratchpad:
+    """Thought/Action/Observation history rendered within a token budget.
+
+    Observations are compact JSON, metadata dicts are sent as diffs against the
+    previous version (the latest full metadata is shown once), and all but the
+    most recent steps are reduced to one-line summaries; the oldest summaries
+    are dropped if still over budget, then long strings in the initial
+    observation (the paper text) are cut further.
+    """
+
+    def __init__(self, header: str, initial_observation: Dict = None,
+                 token_budget: int = PROMPT_TOKEN_BUDGET, keep_recent: int = SCRATCHPAD_KEEP_RECENT):
+        self.header = header
+        self.initial_observation = dict(initial_observation or {})
+        initial_metadata = self.initial_observation.get("metadata")
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.steps = []
+        self._last_metadata = dict(initial_metadata) if isinstance(initial_metadata, dict) else {}
+        self._metadata_updated = False
+
+    def _render_initial_observation(self, char_limit: int) -> str:
+        rendered = {
+            key: _truncate(value, char_limit) if isinstance(value, str) else value
+            for key, value in self.initial_observation.items()
+        }
+        return f"Current observation:\n{_compact_json(rendered)}"
+
+    def _render_observation(self, result: Any) -> str:
+        if not isinstance(result, dict):
+            return _truncate(str(result), OBSERVATION_CHAR_LIMIT)
+        rendered = dict(result)
+        metadata = rendered.get("metadata")
+        if isinstance(metadata, dict):
+            if self._last_metadata:
+                del rendered["metadata"]
+                rendered["metadata_changes"] = _metadata_diff(self._last_metadata, metadata)
+            self._last_metadata = dict(metadata)
+            self._metadata_updated = True
+        return _truncate(_compact_json(rendered), OBSERVATION_CHAR_LIMIT)
+
+    def add_step(self, thought: str, action: str, action_input: str, result: Any):
+        keys = list(result.keys()) if isinstance(result, dict) else []
+        self.steps.append({
+            "full": (f"Thought: {thought}\nAction: {action}\n"
+                     f"Action Input: {_truncate(str(action_input), ACTION_INPUT_CHAR_LIMIT)}\n"
+                     f"Observation: {self._render_observation(result)}"),
+            "summary": f"Action: {action} -> returned {keys}" if keys else f"Action: {action} -> {_truncate(str(result), 80)}"
+        })
+
+    def add_error(self, message: str):
+        self.steps.append({"full": message, "summary": _truncate(message, 120)})
+
+    def render(self) -> str:
+        cutoff = max(0, len(self.steps) - self.keep_recent)
+        older = [step["summary"] for step in self.steps[:cutoff]]
+        recent = [step["full"] for step in self.steps[cutoff:]]
+        dropped = 0
+        observation_limit = OBSERVATION_CHAR_LIMIT
+        while True:
+            parts = [self.header, self._render_initial_observation(observation_limit)]
+            if self._metadata_updated:
+                # Steps only carry diffs, so always show where they have led.
+                parts.append(f"Latest metadata: {_truncate(_compact_json(self._last_metadata), OBSERVATION_CHAR_LIMIT)}")
+            if dropped:
+                parts.append(f"[{dropped} earlier steps omitted]")
+            parts.extend(older[dropped:])
+            parts.extend(recent)
+            prompt = "\n\n".join(parts)
+            if count_tokens(prompt) <= self.token_budget:
+                return prompt
+            if dropped < len(older):
+                dropped += 1
+            elif observation_limit > MIN_OBSERVATION_CHARS:
+                observation_limit = max(MIN_OBSERVATION_CHARS, observation_limit // 2)
+            else:
+                return prompt
+
+def planner_enabled(agent_name: str) -> bool:
+    """AGENT_PLANNER_AGENTS is 'all' or a comma-separated list of agent names."""
+    configured = {name.strip() for name in os.getenv('AGENT_PLANNER_AGENTS', '').split(',') if name.strip()}
+    return "all" in configured or agent_name in configured
+
+def _fill_missing(metadata: Dict, values: Dict, keys: List[str]):
+    for key in keys:
+        if values.get(key) and not metadata.get(key):
+            metadata[key] = values[key]
+
+# Tools that only read the metadata they are given; several of them requested in one
+# turn (or listed back to back in a plan) run concurrently.
+PARALLEL_SAFE_TOOLS = frozenset({"extract_vocabularies", "generate_pids", "assess_quality", "validate_metadata"})
+TOOL_WORKERS = int(os.getenv('AGENT_TOOL_WORKERS', '4'))
+
+_ACTION_PAIR_RE = re.compile(
+    r"^\s*Action\s*:\s*([^\n]+?)\s*\n\s*Action Input\s*:\s*(.*?)(?=^\s*Action\s*:|\Z)",
+    re.IGNORECASE | re.MULTILINE | re.DOTALL
 )
 
+_tool_executor = None
+_tool_executor_lock = threading.Lock()
+
+def _get_tool_executor():
+    global _tool_executor
+    if _tool_executor is None:
+        with _tool_executor_lock:
+            if _tool_executor is None:
+                _tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="agent-tool")
+    return _tool_executor
+
+def _action_groups(actions: List[str]) -> List[List[str]]:
+    """Split actions into runs of consecutive parallel-safe tools; every other action stands alone."""
+    groups = []
+    for action in actions:
+        if groups and action in PARALLEL_SAFE_TOOLS and all(a in PARALLEL_SAFE_TOOLS for a in groups[-1]):
+            groups[-1].append(action)
+        else:
+            groups.append([action])
+    return groups
+
+# Plan steps that judge the metadata; the agent goals are computed from their results.
+CHECK_TOOLS = frozenset({"validate_metadata", "assess_quality"})
+
+def _plan_groups(plan: List[str]) -> List[List[str]]:
+    """Like _action_groups, but checks run on their own so the goal is tested before the next step starts."""
+    groups = []
+    for action in plan:
+        previous = groups[-1] if groups else []
+        joinable = action in PARALLEL_SAFE_TOOLS and action not in CHECK_TOOLS
+        if previous and joinable and all(a in PARALLEL_SAFE_TOOLS and a not in CHECK_TOOLS for a in previous):
+            previous.append(action)
+        else:
+            groups.append([action])
+    return groups
+
 class ReActAgent:
-    def __init__(self, name, system_prompt, tools):
+    def __init__(self, name, system_prompt, tools, plan=None, goal=None, use_planner=None):
         self.name = name
         self.system_prompt = system_prompt
         self.tools = {tool.name: tool for tool in tools}
         self.llm = llm
+        # Planner mode: run the fixed tool sequence without LLM reasoning turns and
+        # only fall back to the ReAct loop when goal(observation) is not met.
+        self.plan = [action for action in (plan or []) if action in self.tools]
+        self.goal = goal
+        self.use_planner = planner_enabled(name) if use_planner is None else use_planner
+    
+    def _apply_result(self, current_observation, action, tool_result):
+        current_observation["last_action"] = action
+        current_observation["last_result"] = tool_result
+        if isinstance(tool_result, dict):
+            current_observation.update(tool_result)
+    
+    def _call_tool(self, action, tool_input):
+        """Returns (result, error)."""
+        try:
+            if isinstance(tool_input, dict):
+                # Called directly: langchain's single-input Tool.run rejects multi-key dicts.
+                return self.tools[action].func(tool_input), None
+            return self.tools[action].run(tool_input), None
+        except Exception as e:
+            return None, e
+    
+    def _run_calls(self, calls):
+        """Run [(action, tool_input)] and return [(result, error)] in the same order."""
+        if len(calls) == 1:
+            return [self._call_tool(*calls[0])]
+        futures = [_get_tool_executor().submit(self._call_tool, action, tool_input) for action, tool_input in calls]
+        return [future.result() for future in futures]
+    
+    def _run_plan(self, current_observation, scratchpad, iterations):
+        """Run the plan group by group; stop as soon as the goal is met and return whether it was."""
+        for group in _plan_groups(self.plan):
+            tool_input = {
+                "metadata": current_observation.get("metadata", {}),
+                "text": current_observation.get("text", "")
+            }
+            outcomes = self._run_calls([(action, tool_input) for action in group])
+            for action, (tool_result, error) in zip(group, outcomes):
+                iterations.append({
+                    "iteration": len(iterations) + 1,
+                    "thought": "planned step",
+                    "action": action,
+                    "action_input": "",
+                    "prompt_tokens": 0,
+                    "planned": True
+                })
+                if error is not None:
+                    print(f"[AGENT:{self.name}] planned tool {action} error: {error}", flush=True)
+                    current_observation["error"] = str(error)
+                    scratchpad.add_error(f"Error executing {action}: {str(error)}")
+                    continue
+                _tool_result_summary(action, tool_result)
+                self._apply_result(current_observation, action, tool_result)
+                # The LLM would carry these into later inputs itself; the plan merges them explicitly.
+                metadata = dict(current_observation.get("metadata") or {})
+                if isinstance(tool_result, dict) and isinstance(tool_result.get("vocabularies"), dict):
+                    _fill_missing(metadata, tool_result["vocabularies"], ["pacs_codes", "mesh_terms", "subject_classifications"])
+                if isinstance(tool_result, dict) and isinstance(tool_result.get("pids"), dict):
+                    _fill_missing(metadata, tool_result["pids"], ["doi", "handle", "ark"])
+                current_observation["metadata"] = metadata
+                scratchpad.add_step("planned step", action, "", tool_result)
+            if self.goal is not None and self.goal(current_observation):
+                return True
+        return self.goal is None
+    
+    def _run_actions(self, thought, calls, current_observation, scratchpad):
+        known = [(action, action_input) for action, action_input in calls if action in self.tools]
+        for action, _ in calls:
+            if action not in self.tools:
+                print(f"[AGENT:{self.name}] unknown action: {action}", flush=True)
+                current_observation["error"] = f"Unknown action: {action}. Available: {', '.join(self.tools.keys())}"
+                scratchpad.add_error(f"Error: Unknown action {action}")
+        
+        position = 0
+        for group in _action_groups([action for action, _ in known]):
+            group_calls = known[position:position + len(group)]
+            position += len(group)
+            # Results are merged in the order the model listed the actions, not completion order.
+            for (action, action_input), (tool_result, error) in zip(group_calls, self._run_calls(group_calls)):
+                if error is not None:
+                    print(f"[AGENT:{self.name}] tool {action} error: {error}", flush=True)
+                    current_observation["error"] = str(error)
+                    scratchpad.add_error(f"Error executing {action}: {str(error)}")
+                    continue
+                _tool_result_summary(action, tool_result)
+                self._apply_result(current_observation, action, tool_result)
+                scratchpad.add_step(thought, action, action_input, tool_result)
     
     def run(self, observation, max_iterations=5):
         iterations = []
-        prompt_template = f"""{self.system_prompt}
+        parallel_tools = [name for name in self.tools if name in PARALLEL_SAFE_TOOLS]
+        header = f"""{self.system_prompt}
 
 Available tools: {', '.join(self.tools.keys())}
 
 Format your response as:
 Thought: [your reasoning about what to do next]
 Action: [tool_name or FINISH]
-Action Input: [input for the tool, or empty if FINISH]
+Action Input: [input for the tool, or empty if FINISH]"""
+        if len(parallel_tools) > 1:
+            header += f"""
 
-Current observation:
-{json.dumps(observation, indent=2)}"""
+Independent tools ({', '.join(parallel_tools)}) may be requested together in one response
+as consecutive Action / Action Input pairs; they run in parallel on the same metadata."""
+        scratchpad = AgentScratchpad(header, initial_observation=observation)
         
         current_observation = observation.copy()
-        _agent_log(self.name, "run started", iterations_max=max_iterations)
+        total_tokens = 0
+        llm_turns = max_iterations
+        _agent_log(self.name, "run started", iterations_max=max_iterations, planner=self.use_planner)
 
-        for i in range(max_iterations):
-            response = self.llm.invoke(prompt_template)
-            thought, action, action_input = self._parse_response(response.content)
-            _agent_log(self.name, f"iteration {i + 1}", thought=thought[:80] + "..." if len(thought) > 80 else thought, action=action)
-
-            iterations.append({
-                "iteration": i + 1,
+        if self.use_planner and self.plan:
+            if self._run_plan(current_observation, scratchpad, iterations):
+                _agent_log(self.name, "finished by planner", steps=len(iterations))
+                current_observation["iterations"] = iterations
+                current_observation["final_thought"] = "Planned tool sequence met the quality threshold"
+                current_observation["prompt_tokens"] = 0
+                current_observation["llm_reasoning_calls"] = 0
+                return current_observation
+            llm_turns = max(1, max_iterations - len(iterations))
+            _agent_log(self.name, "planner below threshold, consulting LLM", iterations_max=llm_turns)
+
+        for i in range(llm_turns):
+            prompt = scratchpad.render()
+            prompt_tokens = count_tokens(prompt)
+            total_tokens += prompt_tokens
+            response = self.llm.invoke(prompt)
+            thought, calls = self._parse_actions(response.content)
+            actions = [action for action, _ in calls]
+            finish = next((j for j, action in enumerate(actions) if action.upper() == "FINISH"), None)
+            if finish is not None:
+                calls = calls[:finish]
+            _agent_log(self.name, f"iteration {i + 1}", thought=thought[:80] + "..." if len(thought) > 80 else thought, action=",".join(actions), prompt_tokens=prompt_tokens)
+
+            iteration = {
+                "iteration": len(iterations) + 1,
                 "thought": thought,
-                "action": action,
-                "action_input": action_input
-            })
-
-            if action == "FINISH" or action.upper() == "FINISH":
+                "action": calls[0][0] if len(calls) == 1 else ("FINISH" if not calls else ",".join(action for action, _ in calls)),
+                "action_input": calls[0][1] if len(calls) == 1 else "",
+                "prompt_tokens": prompt_tokens
+            }
+            if len(calls) > 1:
+                iteration["actions"] = [{"action": action, "action_input": action_input} for action, action_input in calls]
+            iterations.append(iteration)
+
+            if calls:
+                self._run_actions(thought, calls, current_observation, scratchpad)
+
+            if finish is not None:
                 _agent_log(self.name, "finished", final_thought=(thought[:80] + "..." if len(thought) > 80 else thought))
                 current_observation["iterations"] = iterations
                 current_observation["final_thought"] = thought
+                current_observation["prompt_tokens"] = total_tokens
+                current_observation["llm_reasoning_calls"] = i + 1
                 return current_observation
 
-            if action in self.tools:
-                try:
-                    tool_result = self.tools[action].run(action_input)
-                    _tool_result_summary(action, tool_result)
-                    current_observation["last_action"] = action
-                    current_observation["last_result"] = tool_result
-
-                    if isinstance(tool_result, dict):
-                        current_observation.update(tool_result)
-
-                    prompt_template += f"\n\nThought: {thought}\nAction: {action}\nAction Input: {action_input}\nObservation: {json.dumps(tool_result, indent=2) if isinstance(tool_result, dict) else str(tool_result)}"
-                except Exception as e:
-                    print(f"[AGENT:{self.name}] tool {action} error: {e}", flush=True)
-                    current_observation["error"] = str(e)
-                    prompt_template += f"\n\nError executing {action}: {str(e)}"
-            else:
-                print(f"[AGENT:{self.name}] unknown action: {action}", flush=True)
-                current_observation["error"] = f"Unknown action: {action}. Available: {', '.join(self.tools.keys())}"
-                prompt_template += f"\n\nError: Unknown action {action}"
-
         _agent_log(self.name, "max iterations reached")
         current_observation["iterations"] = iterations
+        current_observation["prompt_tokens"] = total_tokens
+        current_observation["llm_reasoning_calls"] = llm_turns
         return current_observation
     
+    def _parse_actions(self, response):
+        """Return (thought, [(action, action_input), ...]); a single action falls back to _parse_response."""
+        pairs = _ACTION_PAIR_RE.findall(response)
+        thought, action, action_input = self._parse_response(response)
+        if len(pairs) <= 1:
+            return thought, [(action, action_input)]
+        return thought, [(name.strip(), value.strip()) for name, value in pairs]
+    
     def _parse_response(self, response):
         thought = ""
         action = "FINISH"
         action_input = ""
         
-        response_lower = response.lower()
-        
-        if "thought:" in response_lower:
-            thought_part = response[response_lower.find("thought:"):]
-            thought = thought_part.split("thought:")[1].split("action:")[0].strip() if "action:" in thought_part.lower() else thought_part.split("thought:")[1].strip()
+        # Markers are matched case-insensitively; splitting on the lowercase marker alone
+        # raised IndexError for the "Thought:" / "Action:" casing the prompt asks for.
+        thought_match = re.search(r"thought\s*:(.*?)(?=action\s*:|\Z)", response, re.IGNORECASE | re.DOTALL)
+        if thought_match:
+            thought = thought_match.group(1).strip()
         
-        if "action:" in response_lower:
-            action_part = response[response_lower.find("action:"):]
-            if "action input:" in action_part.lower():
-                action = action_part.split("action:")[1].split("action input:")[0].strip()
-                action_input = action_part.split("action input:")[1].strip()
+        action_match = re.search(r"action\s*:(.*)", response, re.IGNORECASE | re.DOTALL)
+        if action_match:
+            action_part = action_match.group(1)
+            input_match = re.search(r"action input\s*:", action_part, re.IGNORECASE)
+            if input_match:
+                action = action_part[:input_match.start()].strip()
+                action_input = action_part[input_match.end():].strip()
             else:
-                action = action_part.split("action:")[1].strip().split("\n")[0].strip()
+                action = action_part.strip().split("\n")[0].strip()
         
         return thought, action, action_input
 
@@ -131,11 +407,12 @@ def create_metadata_extraction_tool():
             ("human", "Extract from: {text}")
         ])
         response = llm.invoke(prompt.format_messages(text=str(text)[:8000]))
+        known = extract_header_fields(str(text))
         try:
             result = json.loads(response.content)
-            return {"metadata": result}
+            return {"metadata": {**result, **known}}
         except:
-            return {"metadata": {}}
+            return {"metadata": known}
     
     return Tool(name="extract_metadata", func=extract_metadata, description="Extract comprehensive FAIR metadata from text")
 
@@ -144,21 +421,11 @@ def create_validation_tool():
         if isinstance(metadata_json, dict):
             metadata = metadata_json.get("metadata", metadata_json)
         else:
-            metadata = json.loads(metadata_json) if isinstance(metadata_json, str) else metadata_json
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """Validate FAIR metadata comprehensively. Check:
-- Completeness of required fields
-- Correctness of formats
-- FAIR compliance (Findable, Accessible, Interoperable, Reusable)
-Return JSON with is_valid, missing_fields, errors, warnings, completeness_score, fair_scores."""),
-            ("human", "Validate: {metadata}")
-        ])
-        response = llm.invoke(prompt.format_messages(metadata=json.dumps(metadata, indent=2)))
-        try:
-            return {"validation_result": json.loads(response.content)}
-        except:
-            return {"validation_result": {"is_valid": False, "errors": ["Validation failed"]}}
+            try:
+                metadata = json.loads(metadata_json) if isinstance(metadata_json, str) else metadata_json
+            except ValueError:
+                return {"validation_result": {"is_valid": False, "errors": ["Validation input is not JSON"]}}
+        return {"validation_result": metadata_validator.validate(metadata)}
     
     return Tool(name="validate_metadata", func=validate_metadata, description="Validate FAIR metadata for completeness, correctness, and FAIR compliance")
 
@@ -294,6 +561,24 @@ Return JSON with pacs_codes (array), mesh_terms (array), subject_classifications
     
     return Tool(name="extract_vocabularies", func=extract_vocabularies, description="Extract PACS codes, MeSH terms, and subject classifications from metadata and text")
 
+def _score(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _completeness_goal(threshold):
+    def goal(observation):
+        validation = observation.get("validation_result") or {}
+        return bool(validation.get("is_valid")) and _score(validation.get("completeness_score")) >= threshold
+    return goal
+
+def _quality_goal(threshold):
+    def goal(observation):
+        quality = observation.get("quality_assessment") or {}
+        return _score(quality.get("quality_score")) >= threshold
+    return goal
+
 def create_metadata_extraction_agent():
     tools = [
         create_metadata_extraction_tool(),
@@ -315,7 +600,8 @@ Reasoning process:
 
 Be methodical: extract → validate → enrich → validate → finish"""
     
-    return ReActAgent("metadata_extractor", system_prompt, tools)
+    plan = ["extract_metadata", "validate_metadata", "enrich_metadata", "extract_vocabularies", "validate_metadata"]
+    return ReActAgent("metadata_extractor", system_prompt, tools, plan=plan, goal=_completeness_goal(0.9))
 
 def create_curation_agent():
     tools = [
@@ -345,7 +631,8 @@ Deep reasoning process:
 
 Think deeply about what's needed, don't just apply tools randomly. Be strategic."""
     
-    return ReActAgent("curation_agent", system_prompt, tools)
+    plan = ["assess_quality", "generate_pids", "extract_vocabularies", "enrich_metadata", "validate_metadata", "assess_quality"]
+    return ReActAgent("curation_agent", system_prompt, tools, plan=plan, goal=_quality_goal(0.8))
 
 def create_quality_agent():
     tools = [
@@ -374,4 +661,5 @@ Deep quality analysis process:
 
 Be thorough and analytical. Don't stop until quality is excellent."""
     
-    return ReActAgent("quality_agent", system_prompt, tools)
+    plan = ["assess_quality", "enrich_metadata", "extract_vocabularies", "generate_pids", "validate_metadata", "assess_quality"]
+    return ReActAgent("quality_agent", system_prompt, tools, plan=plan, goal=_quality_goal(0.85))
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import uuid
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Room for the multipart framing and small form fields around the file itself.
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+class UploadError(ValueError):
+    pass
+
+class UploadTooLarge(Exception):
+    pass
+
+class MultipartFileSink:
+    """Parses a multipart/form-data body as it arrives and streams one file field straight to disk.
+
+    The file is hashed and sized on the way and the byte limit applies while parsing, so an
+    oversized upload is refused without being buffered, whether or not it sent Content-Length.
+    """
+
+    def __init__(self, content_type, upload_dir, field_name="file", max_bytes=None, suffix=None):
+        ctype, params = parse_options_header(content_type or "")
+        if ctype != b"multipart/form-data" or not params.get(b"boundary"):
+            raise UploadError("Expected a multipart/form-data upload")
+        self.field_name = field_name.encode()
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.temp_path = os.path.join(str(upload_dir), f".upload-{uuid.uuid4().hex}.part")
+        self.filename = None
+        self.size = 0
+        self.file_hash = None
+        self.body_size = 0
+        self._digest = hashlib.sha256()
+        self._file = None
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.filename is not None or params.get(b"name") != self.field_name or b"filename" not in params:
+            return
+        filename = os.path.basename(params[b"filename"].decode("utf-8", "replace"))
+        if not filename or (self.suffix and not filename.endswith(self.suffix)):
+            raise UploadError(f"Only {self.suffix} files are supported" if self.suffix else "Missing filename")
+        self.filename = filename
+        self._file = open(self.temp_path, "wb")
+
+    def _on_part_data(self, data, start, end):
+        if self._file is None:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(f"File exceeds the {self.max_bytes} byte upload limit")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def _on_part_end(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, data):
+        self.body_size += len(data)
+        if self.max_bytes is not None and self.body_size > self.max_bytes + FORM_OVERHEAD_BYTES:
+            raise UploadTooLarge(f"File exceeds the {self.max_bytes} byte upload limit")
+        self._parser.write(data)
+
+    def finish(self):
+        """Return (filename, sha256 hex digest, size) once the whole body has been written."""
+        self._parser.finalize()
+        if self.filename is None:
+            raise UploadError(f"No '{self.field_name.decode()}' file field in the upload")
+        if self._file is not None:
+            raise UploadError("Upload ended before the file part was complete")
+        self.file_hash = self._digest.hexdigest()
+        return self.filename, self.file_hash, self.size
+
+    def cleanup(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)